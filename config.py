@@ -47,6 +47,22 @@ def validate_file(file, max_size_mb: int = 100) -> bool:
     
     return True
 
+def format_file_size(size_bytes) -> str:
+    """
+    Formatea un tamaño en bytes para mostrarlo en la interfaz.
+
+    Args:
+        size_bytes: Tamaño en bytes (int). Si ya es un texto formateado se devuelve tal cual.
+
+    Returns:
+        str: Tamaño legible en KB o MB.
+    """
+    if isinstance(size_bytes, str):
+        return size_bytes  # Registros antiguos guardaban el tamaño ya formateado
+    if size_bytes >= 1024 * 1024:
+        return f"{size_bytes / (1024 * 1024):.2f} MB"
+    return f"{size_bytes / 1024:.2f} KB"
+
 def generate_file_hash(content: bytes) -> str:
     """
     Genera un hash único para el archivo usando MD5.
@@ -59,6 +75,24 @@ def generate_file_hash(content: bytes) -> str:
     """
     return hashlib.md5(content).hexdigest()
 
+def generate_file_hash_stream(file_obj, chunk_size: int = 1 << 20) -> str:
+    """
+    Genera el hash MD5 de un archivo leyéndolo por bloques.
+
+    Args:
+        file_obj: Objeto tipo archivo en modo binario (p. ej. UploadedFile de Streamlit).
+        chunk_size (int): Tamaño de cada bloque leído (por defecto 1 MiB).
+
+    Returns:
+        str: Hash MD5 en formato hexadecimal (igual que generate_file_hash).
+    """
+    file_obj.seek(0)
+    digest = hashlib.md5()
+    for chunk in iter(lambda: file_obj.read(chunk_size), b""):
+        digest.update(chunk)
+    file_obj.seek(0)
+    return digest.hexdigest()
+
 def clean_text(text: str) -> str:
     """
     Realiza una limpieza básica del texto.
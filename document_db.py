@@ -5,6 +5,29 @@ import uuid
 import json
 from datetime import datetime
 
+# orjson es opcional: serializa/deserializa varias veces más rápido que json
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def json_dumps(value: Any) -> str:
+    """Serializa a JSON (texto) usando orjson si está disponible; lo no serializable lanza TypeError, como json.dumps"""
+    if orjson is not None:
+        # Fechas y dataclasses no se serializan de forma nativa: fallan igual que con json
+        options = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+        return orjson.dumps(value, option=options).decode("utf-8")
+    return json.dumps(value)
+
+
+def json_loads(data: str) -> Any:
+    """Deserializa JSON usando orjson si está disponible"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
 class DocumentDB:
     def __init__(self, db_path: str = "BD/document_manager.db"):
         # Ruta al archivo de base de datos SQLite
@@ -28,6 +51,18 @@ class DocumentDB:
                     updated_at TEXT NOT NULL
                 )
             """)
+            # Huella (hash del contenido, tamaño en bytes) para detectar archivos ya indexados;
+            # las bases creadas antes de existir estas columnas se migran aquí
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(documents)")}
+            if 'file_size_bytes' not in columns:
+                conn.execute("ALTER TABLE documents ADD COLUMN file_size_bytes INTEGER")
+            if 'content_hash' not in columns:
+                conn.execute("ALTER TABLE documents ADD COLUMN content_hash TEXT")
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_documents_fingerprint "
+                "ON documents (content_hash, file_size_bytes)"
+            )
+            
             #BORRAR TABLA processed_docs si existe
             
             
@@ -55,7 +90,7 @@ class DocumentDB:
                 (key, value, updated_at)
                 VALUES (?, ?, ?)
                 """,
-                (key, json.dumps(value), datetime.now().isoformat())
+                (key, json_dumps(value), datetime.now().isoformat())
             )
     
     def get_state(self, key: str, default: Optional[Any] = None) -> Any:
@@ -68,7 +103,30 @@ class DocumentDB:
             result = cursor.fetchone()
         
         # Devuelve el valor si existe, si no devuelve el valor por defecto
-        return json.loads(result[0]) if result else default
+        return json_loads(result[0]) if result else default
+    
+    def increment_state(self, key: str) -> int:
+        """Incrementa un contador del estado de la aplicación y devuelve el nuevo valor"""
+        with self._get_connection() as conn:
+            result = conn.execute("SELECT value FROM app_state WHERE key = ?", (key,)).fetchone()
+            value = (json_loads(result[0]) if result else 0) + 1
+            conn.execute(
+                "INSERT OR REPLACE INTO app_state (key, value, updated_at) VALUES (?, ?, ?)",
+                (key, json_dumps(value), datetime.now().isoformat())
+            )
+        return value
+    
+    def _bump_documents_version(self, conn: sqlite3.Connection) -> None:
+        """Incrementa 'documents_version' dentro de la transacción que añade, elimina o cambia el estado de documentos
+        
+        Permite a la interfaz cachear conteos de documentos (totales y por estado) hasta el siguiente cambio.
+        """
+        result = conn.execute("SELECT value FROM app_state WHERE key = 'documents_version'").fetchone()
+        conn.execute(
+            "INSERT OR REPLACE INTO app_state (key, value, updated_at) VALUES (?, ?, ?)",
+            ('documents_version', json_dumps((json_loads(result[0]) if result else 0) + 1),
+             datetime.now().isoformat())
+        )
     
     def delete_state(self, key: str) -> None:
         """Elimina un valor del estado de la aplicación"""
@@ -81,29 +139,49 @@ class DocumentDB:
     # Métodos existentes para documentos (se mantienen igual)
     def add_document(self, file_path: str, file_type: str, metadata: Optional[Dict] = None) -> str:
         """Añade un nuevo documento a la base de datos"""
-        doc_id = str(uuid.uuid4())  # Genera un ID único para el documento
-        now = datetime.now().isoformat()  # Marca de tiempo actual
+        return self.add_documents_bulk([(file_path, file_type, metadata)])[0]
+    
+    def add_documents_bulk(self, items: List[Tuple[str, str, Optional[Dict]]]) -> List[str]:
+        """Añade varios documentos en una sola transacción
+        
+        Args:
+            items: Lista de tuplas (ruta, tipo, metadatos)
+            
+        Returns:
+            Lista de IDs asignados, en el mismo orden que items
+        """
+        now = datetime.now().isoformat()
+        doc_ids = [str(uuid.uuid4()) for _ in items]
+        rows = []
+        for doc_id, (file_path, file_type, metadata) in zip(doc_ids, items):
+            stat = Path(file_path).stat()
+            rows.append((
+                doc_id,
+                file_path,
+                Path(file_path).name,  # Nombre del archivo
+                file_type.lower(),  # Tipo de archivo en minúsculas
+                f"{stat.st_size / 1024:.2f} KB",  # Tamaño en KB
+                'Pendiente',  # Estado inicial del documento
+                json_dumps(metadata or {}),  # Metadatos serializados
+                now,
+                now,
+                stat.st_size,  # Huella: tamaño en bytes
+                (metadata or {}).get('hash')  # Huella: hash del contenido
+            ))
         
+        # Un solo commit para todo el lote
         with self._get_connection() as conn:
-            conn.execute(
+            conn.executemany(
                 """
                 INSERT INTO documents 
-                (id, path, file_name, file_type, file_size, status, metadata, created_at, updated_at)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                (id, path, file_name, file_type, file_size, status, metadata, created_at, updated_at,
+                 file_size_bytes, content_hash)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
                 """,
-                (
-                    doc_id,
-                    file_path,
-                    Path(file_path).name,  # Nombre del archivo
-                    file_type.lower(),  # Tipo de archivo en minúsculas
-                    f"{Path(file_path).stat().st_size / 1024:.2f} KB",  # Tamaño en KB
-                    'Pendiente',  # Estado inicial del documento
-                    json.dumps(metadata or {}),  # Metadatos serializados
-                    now,
-                    now
-                )
+                rows
             )
-        return doc_id
+            self._bump_documents_version(conn)
+        return doc_ids
     
     def update_document_status(self, file_path: str, status: str) -> None:
         """Actualiza el estado de un documento"""
@@ -112,6 +190,17 @@ class DocumentDB:
                 "UPDATE documents SET status = ?, updated_at = ? WHERE path = ?",
                 (status, datetime.now().isoformat(), file_path)
             )
+            self._bump_documents_version(conn)
+    
+    def update_document_statuses_bulk(self, file_paths: List[str], status: str) -> None:
+        """Actualiza el estado de varios documentos en una sola transacción"""
+        now = datetime.now().isoformat()
+        with self._get_connection() as conn:
+            conn.executemany(
+                "UPDATE documents SET status = ?, updated_at = ? WHERE path = ?",
+                [(status, now, file_path) for file_path in file_paths]
+            )
+            self._bump_documents_version(conn)
     
     def get_document(self, file_path: str) -> Optional[Dict]:
         """Obtiene un documento por su ruta"""
@@ -121,6 +210,27 @@ class DocumentDB:
         
         return self._row_to_dict(row, 'documents') if row else None
     
+    def get_document_by_fingerprint(self, content_hash: str, file_size_bytes: int) -> Optional[Dict]:
+        """Obtiene un documento indexado con el mismo contenido (hash y tamaño), en cualquier ruta
+        
+        Returns:
+            El documento si ese contenido ya fue indexado, si no None
+            
+        Notas:
+            - Los registros anteriores a la huella tienen content_hash NULL y nunca coinciden
+        """
+        with self._get_connection() as conn:
+            cursor = conn.execute(
+                """
+                SELECT * FROM documents
+                WHERE content_hash = ? AND file_size_bytes = ? AND status = 'Indexado'
+                LIMIT 1
+                """,
+                (content_hash, file_size_bytes)
+            )
+            row = cursor.fetchone()
+        return self._row_to_dict(row, 'documents') if row else None
+    
     def get_all_documents(self, status_filter: Optional[str] = None) -> List[Dict]:
         """Obtiene todos los documentos con filtro opcional por estado"""
         query = "SELECT * FROM documents ORDER BY created_at DESC"
@@ -147,6 +257,7 @@ class DocumentDB:
                 #conn.execute("DELETE FROM processed_docs WHERE document_id = ?", (doc_id,))
                 # Elimina el documento
                 conn.execute("DELETE FROM documents WHERE id = ?", (doc_id,))
+                self._bump_documents_version(conn)
     
     
     def clear_processed_chunks(self) -> None:
@@ -164,16 +275,18 @@ class DocumentDB:
                 'file_type': row[3],
                 'file_size': row[4],
                 'status': row[5],
-                'metadata': json.loads(row[6]),
+                'metadata': json_loads(row[6]),
                 'created_at': row[7],
-                'updated_at': row[8]
+                'updated_at': row[8],
+                'file_size_bytes': row[9],
+                'content_hash': row[10]
             }
         elif table == 'processed_docs':
             return {
                 'id': row[0],
                 'document_id': row[1],
                 'content': row[2],
-                'metadata': json.loads(row[3]),
+                'metadata': json_loads(row[3]),
                 'created_at': row[4]
             }
     
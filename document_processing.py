@@ -1,7 +1,8 @@
+import os
+import time
 from typing import List, Dict, Optional
 from datetime import datetime
 import uuid
-from pathlib import Path
 
 # Importaciones para procesamiento de documentos
 from langchain_core.documents import Document
@@ -96,19 +97,21 @@ def process_single_document(
     if not docs:
         return []  # Si no se cargó ningún documento, retornar lista vacía
     
-    # 2. Preparar metadatos base del archivo
+    # 2. Preparar metadatos base del archivo (nombre y tamaño se reutilizan si ya vienen
+    #    en los metadatos adicionales, p. ej. de get_file_metadata: un solo stat por archivo)
+    additional_metadata = additional_metadata or {}
     file_metadata = {
         'source': file_path,  # Ruta del archivo
-        'file_name': Path(file_path).name,  # Nombre del archivo
+        'file_name': additional_metadata.get('file_name') or os.path.basename(file_path),  # Nombre del archivo
         'file_type': file_type.lower(),     # Tipo de archivo en minúsculas
-        'file_size': f"{Path(file_path).stat().st_size / 1024:.2f} KB",  # Tamaño del archivo en KB
+        'file_size_bytes': (additional_metadata['file_size_bytes'] if 'file_size_bytes' in additional_metadata
+                            else os.stat(file_path).st_size),  # Tamaño del archivo en bytes
         'processing_time': datetime.now().isoformat(),  # Marca temporal del procesamiento
         'document_id': str(uuid.uuid4()),   # Identificador único del documento
     }
     
     # 3. Combinar con metadatos adicionales (si se proporcionan)
-    if additional_metadata:
-        file_metadata.update(additional_metadata)
+    file_metadata.update(additional_metadata)
     
     # 4. Limpiar contenido y actualizar metadatos
     for doc in docs:
@@ -133,3 +136,49 @@ def process_single_document(
             chunk.metadata['page_label'] = f"Página {int(chunk.metadata['page']) + 1}"
     
     return chunks
+
+def get_file_metadata(
+    file_path: str,
+    file_type: str,
+    upload_time: Optional[str] = None
+) -> Dict:
+    """
+    Genera los metadatos estandarizados de un archivo subido.
+
+    Args:
+        file_path (str): Ruta completa del archivo.
+        file_type (str): Tipo/extensión del archivo.
+        upload_time (Optional[str]): Marca temporal compartida por el lote (opcional).
+
+    Returns:
+        Dict: source, file_name, file_type, upload_time y file_size_bytes
+        (numérico, se formatea solo al mostrarlo).
+    """
+    if upload_time is None:
+        upload_time = time.strftime("%Y-%m-%d %H:%M:%S")
+
+    return {
+        'source': file_path,
+        'file_name': os.path.basename(file_path),
+        'file_type': file_type,
+        'upload_time': upload_time,
+        'file_size_bytes': os.stat(file_path).st_size
+    }
+
+def parse_file(file_path: str, file_type: str, upload_time: Optional[str] = None) -> List[Document]:
+    """
+    Obtiene los metadatos de un archivo y lo procesa en chunks.
+
+    Se ejecuta en hilos o en procesos hijos: vive en este módulo ligero para que
+    cada proceso solo importe los loaders, no streamlit ni el stack de embeddings.
+
+    Args:
+        file_path (str): Ruta al archivo a procesar.
+        file_type (str): Extensión del archivo (.pdf, .docx, etc.).
+        upload_time (Optional[str]): Marca temporal compartida por el lote.
+
+    Returns:
+        List[Document]: Chunks del documento con metadatos enriquecidos.
+    """
+    file_metadata = get_file_metadata(file_path, file_type, upload_time=upload_time)
+    return process_single_document(file_path, file_type, additional_metadata=file_metadata)
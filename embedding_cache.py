@@ -0,0 +1,166 @@
+import os
+import time
+import sqlite3
+import hashlib
+from typing import List, Dict
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+# blake3 es opcional: si no está instalado se usa blake2b de la biblioteca estándar
+try:
+    from blake3 import blake3 as _blake3
+except ImportError:
+    _blake3 = None
+
+
+def content_key(text: str, model_name: str) -> bytes:
+    """
+    Genera la clave de caché de un texto para un modelo concreto.
+
+    Args:
+        text (str): Texto del chunk.
+        model_name (str): Identificador del modelo de embeddings (ver `model_signature`).
+
+    Returns:
+        bytes: Hash de 32 bytes de (texto || modelo).
+    """
+    data = text.encode("utf-8") + b"\x00" + model_name.encode("utf-8")
+    if _blake3 is not None:
+        return _blake3(data).digest()
+    return hashlib.blake2b(data, digest_size=32).digest()
+
+
+def model_signature(embed_model: Embeddings) -> str:
+    """
+    Identifica el modelo junto con su backend y precisión numérica.
+
+    Los vectores de un mismo modelo difieren ligeramente entre ONNX, FP16, FP32 e
+    int8, así que cada combinación usa claves de caché distintas.
+
+    Args:
+        embed_model (Embeddings): Modelo de embeddings (p. ej. HuggingFaceEmbeddings).
+
+    Returns:
+        str: "modelo|backend|precisión".
+    """
+    name = getattr(embed_model, 'model_name', str(embed_model))
+    client = getattr(embed_model, '_client', None) or getattr(embed_model, 'client', None)
+    if client is None:
+        return f"{name}|unknown|unknown"
+
+    backend = getattr(client, 'backend', 'torch')
+    precision = 'fp32'
+    if backend == 'torch' and hasattr(client, 'modules'):
+        # Capas lineales sustituidas por quantize_dynamic (torch.ao.nn.quantized.dynamic)
+        if any('quantized' in type(module).__module__ for module in client.modules()):
+            precision = 'int8'
+        else:
+            param = next(client.parameters(), None)
+            if param is not None:
+                precision = str(param.dtype).replace('torch.', '')
+    return f"{name}|{backend}|{precision}"
+
+
+class CachedEmbedder(Embeddings):
+    """Envuelve un modelo de embeddings con una caché persistente direccionada por contenido.
+
+    Los vectores de `embed_documents` se guardan en SQLite con la clave
+    hash(texto || modelo|backend|precisión); en cargas posteriores los chunks
+    idénticos no se vuelven a embeber. Las consultas (`embed_query`) no se cachean.
+    Al superar `max_entries` se descartan los vectores usados hace más tiempo.
+    """
+
+    def __init__(self, embed_model: Embeddings, cache_dir: str = "BD/embedcache",
+                 max_entries: int = 200_000):
+        self.embed_model = embed_model
+        self.model_name = getattr(embed_model, 'model_name', str(embed_model))
+        self.model_signature = model_signature(embed_model)
+        self.max_entries = max_entries
+        os.makedirs(cache_dir, exist_ok=True)
+        self.db_path = os.path.join(cache_dir, "embeddings.db")
+        self._init_db()
+
+    def __getattr__(self, name):
+        # Delegar atributos desconocidos (p. ej. encode_kwargs) al modelo envuelto
+        if name == 'embed_model':
+            raise AttributeError(name)
+        return getattr(self.embed_model, name)
+
+    def _init_db(self) -> None:
+        """Crea la tabla de vectores si no existe"""
+        with self._get_connection() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS embeddings (
+                    key BLOB PRIMARY KEY,
+                    vector BLOB NOT NULL,
+                    last_used REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings (last_used)")
+
+    def _get_connection(self) -> sqlite3.Connection:
+        """Obtiene una conexión a la base de datos de la caché"""
+        return sqlite3.connect(self.db_path)
+
+    def _lookup(self, keys: List[bytes]) -> Dict[bytes, List[float]]:
+        """Devuelve los vectores cacheados para las claves encontradas"""
+        found = {}
+        with self._get_connection() as conn:
+            # Consultas por lotes para no superar el límite de parámetros de SQLite
+            for i in range(0, len(keys), 500):
+                batch = keys[i:i + 500]
+                placeholders = ",".join("?" * len(batch))
+                cursor = conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})",
+                    batch
+                )
+                for key, blob in cursor.fetchall():
+                    found[key] = np.frombuffer(blob, dtype=np.float32).tolist()
+            # Marcar los aciertos como usados recientemente (orden de desalojo)
+            if found:
+                now = time.time()
+                conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                    [(now, key) for key in found]
+                )
+        return found
+
+    def _store(self, items: Dict[bytes, List[float]]) -> None:
+        """Persiste nuevos vectores en una sola transacción y desaloja los más antiguos si se supera el límite"""
+        now = time.time()
+        with self._get_connection() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                [(key, np.asarray(vec, dtype=np.float32).tobytes(), now) for key, vec in items.items()]
+            )
+            excess = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0] - self.max_entries
+            if excess > 0:
+                conn.execute(
+                    "DELETE FROM embeddings WHERE key IN "
+                    "(SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+                    (excess,)
+                )
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embebe textos reutilizando los vectores cacheados y calculando solo los faltantes"""
+        keys = [content_key(text, self.model_signature) for text in texts]
+        cached = self._lookup(list(set(keys)))
+
+        # Textos sin vector en caché (sin repetir claves)
+        misses = {}
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in misses:
+                misses[key] = text
+
+        if misses:
+            vectors = self.embed_model.embed_documents(list(misses.values()))
+            new_items = dict(zip(misses.keys(), vectors))
+            self._store(new_items)
+            cached.update(new_items)
+
+        return [list(cached[key]) for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        """Embebe una consulta directamente con el modelo envuelto"""
+        return self.embed_model.embed_query(text)
@@ -12,7 +12,7 @@ from typing import List, Dict, Tuple, Optional
 from datetime import datetime
 import streamlit as st
 from streamlit_pdf_viewer import pdf_viewer
-from config import validate_file, generate_file_hash, get_file_extension
+from config import validate_file, generate_file_hash_stream, get_file_extension, format_file_size
 
 class FileManager:
     """Gestor de archivos para manejar operaciones de carga, validación y limpieza de documentos
@@ -54,7 +54,7 @@ class FileManager:
                 
             # Construcción de ruta de guardado    
             file_path = os.path.join(self.temp_dir, uploaded_file.name)
-            # Escritura del contenido del archivo
+            # Escritura del contenido (getbuffer: vista sin copia del archivo ya en memoria)
             with open(file_path, "wb") as f:
                 f.write(uploaded_file.getbuffer())
             return file_path
@@ -113,12 +113,14 @@ class FileManager:
         """
         valid_files = []  # Archivos válidos para procesar
         new_file_details = []  # Metadatos de nuevos archivos
+        # Marca temporal común a todos los archivos de esta carga
+        upload_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         
         for file in uploaded_files:
             try:
                 if validate_file(file):
-                    file_content = file.getvalue()
-                    file_hash = generate_file_hash(file_content)  # Hash único del contenido
+                    # Hash único del contenido, calculado por bloques sin copiar el archivo entero
+                    file_hash = generate_file_hash_stream(file)
                     
                     # Verificar si el archivo ya fue indexado completamente
                     existing_file = next((f for f in existing_files 
@@ -140,18 +142,18 @@ class FileManager:
                             # Actualizar archivo existente no indexado
                             unindexed_file.update({
                                 "path": file_path,
-                                "upload_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                                "upload_time": upload_time,
                                 "status": "Pendiente"
                             })
                         else:
                             # Crear metadatos para nuevo archivo
                             new_file_details.append({
                                 "name": file.name,
-                                "size": f"{round(file.size / (1024 * 1024), 2)} MB",
+                                "size": file.size,  # Bytes; se formatea al mostrarlo
                                 "type": get_file_extension(file.name),
                                 "hash": file_hash,
                                 "path": file_path,
-                                "upload_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                                "upload_time": upload_time,
                                 "status": "Pendiente"
                             })
                     else:
@@ -304,7 +306,7 @@ class FileManager:
                 st.metric("Tipo", selected_file.get('type', 'Desconocido'))
             with col2:
                 if 'size' in selected_file:
-                    st.metric("Tamaño", selected_file['size'])
+                    st.metric("Tamaño", format_file_size(selected_file['size']))
             with col3:
                 if 'upload_time' in selected_file:
                     st.metric("Subido", selected_file['upload_time'])
@@ -1,7 +1,7 @@
 import os
 import warnings
 from pathlib import Path
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Literal
 import logging
 import json
 from functools import lru_cache
@@ -21,12 +21,18 @@ logger = logging.getLogger(__name__)
 from langchain_groq import ChatGroq
 from langchain_chroma import Chroma
 from langchain_community.retrievers import BM25Retriever
-from langchain.retrievers import EnsembleRetriever
-from langchain_core.prompts import PromptTemplate
 from langchain.chains import RetrievalQA
 from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_core.documents import Document
 
+from rag_components import (
+    FAISSRetriever,
+    NumpyEnsembleRetriever,
+    PresplitPromptTemplate,
+    iter_stored_texts,
+    load_or_build_ivfpq_index,
+)
+
 import torch
 
 
@@ -43,7 +49,8 @@ class RAGSystem:
                  #meta-llama/llama-4-maverick-17b-128e-instruct
                  model_name: str = "meta-llama/llama-4-maverick-17b-128e-instruct",
                  #model_name: str = "llama3-8b-8192",
-                 temperature: float = 0.8):
+                 temperature: float = 0.8,
+                 backend: Literal["chroma", "faiss_ivfpq"] = "chroma"):
         """
         Inicializa el sistema RAG con configuración personalizable.
         
@@ -52,11 +59,13 @@ class RAGSystem:
             chroma_dir: Directorio de la base de datos vectorial
             model_name: Modelo de LLM a utilizar
             temperature: Temperatura para la generación
+            backend: Índice para la búsqueda vectorial ("chroma" o "faiss_ivfpq" para colecciones grandes)
         """
         self.collection_name = collection_name
         self.chroma_dir = chroma_dir
         self.model_name = model_name
         self.temperature = temperature
+        self.backend = backend
         
         # Verificar API key
         self.groq_api_key = os.getenv("GROQ_API_KEY")
@@ -104,12 +113,24 @@ class RAGSystem:
         device = 'cuda' if torch.cuda.is_available() else 'cpu'
         logger.info(f"Usando dispositivo para embeddings: {device}")
         
+        model_kwargs = {'device': device}
+        if device == 'cuda':
+            # En GPU, cargar los pesos directamente en FP16 (la normalización absorbe la pérdida de precisión)
+            model_kwargs['model_kwargs'] = {'torch_dtype': torch.float16}
+            logger.info("⚡ Modelo de embeddings en FP16")
+        
         try:
-            return HuggingFaceEmbeddings(
+            embeddings = HuggingFaceEmbeddings(
                 model_name="sentence-transformers/all-MiniLM-L6-v2",
-                model_kwargs={'device': device},
-                encode_kwargs={'normalize_embeddings': True}
+                model_kwargs=model_kwargs,
+                encode_kwargs={
+                    'normalize_embeddings': True,
+                    'convert_to_numpy': True,
+                    'batch_size': 128
+                }
             )
+            
+            return embeddings
         except Exception as e:
             logger.error(f"Error configurando embeddings: {e}")
             raise
@@ -140,9 +161,10 @@ class RAGSystem:
             
             logger.info(f"✅ Base vectorial cargada: {count} documentos en '{self.collection_name}'")
             
-            # Obtener documentos para BM25
-            stored_data = vectorstore.get()
-            self.docs = stored_data['documents'] if stored_data['documents'] else []
+            # Obtener documentos para BM25 por páginas (solo textos, sin metadatos)
+            self.docs = []
+            for batch in iter_stored_texts(vectorstore, total=count):
+                self.docs.extend(batch)
             
             if not self.docs:
                 logger.warning("No se encontraron documentos para BM25")
@@ -153,17 +175,36 @@ class RAGSystem:
             logger.error(f"Error cargando vectorstore: {e}")
             raise
     
-    def _setup_retriever(self) -> EnsembleRetriever:
+    def _setup_vector_retriever(self):
+        """Configura el recuperador vectorial según el backend elegido (Chroma o FAISS IVF-PQ)."""
+        if self.backend == "faiss_ivfpq":
+            try:
+                index_path = str(Path(self.chroma_dir) / f"{self.collection_name}.ivfpq")
+                index, ids = load_or_build_ivfpq_index(self.vectorstore, index_path)
+                logger.info("✅ Recuperador vectorial FAISS IVF-PQ configurado")
+                return FAISSRetriever(
+                    index=index,
+                    ids=ids,
+                    vectorstore=self.vectorstore,
+                    embed_model=self.embed_model,
+                    k=8
+                )
+            except Exception as e:
+                logger.warning(f"No se pudo usar FAISS IVF-PQ, se usa Chroma: {e}")
+        
+        return self.vectorstore.as_retriever(
+            search_type="similarity_score_threshold",
+            search_kwargs={
+                "k": 8,
+                "score_threshold": 0.3
+            }
+        )
+    
+    def _setup_retriever(self) -> NumpyEnsembleRetriever:
         """Configura el sistema de recuperación híbrida (vectorial + BM25)."""
         try:
             # Recuperador vectorial
-            vector_retriever = self.vectorstore.as_retriever(
-                search_type="similarity_score_threshold",
-                search_kwargs={
-                    "k": 8,
-                    "score_threshold": 0.3
-                }
-            )
+            vector_retriever = self._setup_vector_retriever()
             
             # Recuperador BM25 (solo si hay documentos)
             if self.docs:
@@ -171,7 +212,7 @@ class RAGSystem:
                 bm25_retriever.k = 8
                 
                 # Ensemble de ambos recuperadores
-                ensemble_retriever = EnsembleRetriever(
+                ensemble_retriever = NumpyEnsembleRetriever(
                     retrievers=[vector_retriever, bm25_retriever],
                     weights=[0.6, 0.4]  # Más peso al vectorial
                 )
@@ -216,7 +257,8 @@ class RAGSystem:
 
 **Respuesta basada en los documentos:**"""
 
-        prompt = PromptTemplate(
+        # Plantilla pre-dividida: se formatea por concatenación en cada consulta
+        prompt = PresplitPromptTemplate(
             template=prompt_template,
             input_variables=['context', 'question']
         )
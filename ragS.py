@@ -1,10 +1,13 @@
 import os
 import warnings
 from pathlib import Path
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Literal
 import logging
 import json
 from functools import lru_cache
+import importlib.util
+
+import httpx
 
 # Suprimir advertencias
 warnings.filterwarnings("ignore", message=".*torch.classes.*")
@@ -22,12 +25,18 @@ logger = logging.getLogger(__name__)
 from langchain_ollama import ChatOllama  # Cambio de langchain_groq a langchain_ollama
 from langchain_chroma import Chroma
 from langchain_community.retrievers import BM25Retriever
-from langchain.retrievers import EnsembleRetriever
-from langchain_core.prompts import PromptTemplate
 from langchain.chains import RetrievalQA
 from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_core.documents import Document
 
+from rag_components import (
+    FAISSRetriever,
+    NumpyEnsembleRetriever,
+    PresplitPromptTemplate,
+    iter_stored_texts,
+    load_or_build_ivfpq_index,
+)
+
 import torch
 
 
@@ -44,7 +53,8 @@ class RAGSystem:
                  # CAMBIOS AQUÍ - configuración para Ollama
                  model_name: str = "llama3.1:8b",  # Nombre del modelo en Ollama
                  ollama_base_url: str = f"https://{id_runpod}-11434.proxy.runpod.net",  # URL base de RunPod
-                 temperature: float = 0.8):
+                 temperature: float = 0.8,
+                 backend: Literal["chroma", "faiss_ivfpq"] = "chroma"):
         """
         Inicializa el sistema RAG con configuración personalizable para Ollama.
         
@@ -54,12 +64,14 @@ class RAGSystem:
             model_name: Modelo de Ollama a utilizar (ej: "llama3.1:8b")
             ollama_base_url: URL base del servidor Ollama
             temperature: Temperatura para la generación
+            backend: Índice para la búsqueda vectorial ("chroma" o "faiss_ivfpq" para colecciones grandes)
         """
         self.collection_name = collection_name
         self.chroma_dir = chroma_dir
         self.model_name = model_name
         self.ollama_base_url = ollama_base_url
         self.temperature = temperature
+        self.backend = backend
         
         # Ya no necesitamos verificar API key para Ollama
         logger.info(f"🔗 Configurando conexión a Ollama en RunPod: {ollama_base_url}")
@@ -101,6 +113,8 @@ class RAGSystem:
                 num_ctx=4096,  # Tamaño del contexto
                 repeat_penalty=1.1,
                 # streaming=False  # Ollama maneja streaming automáticamente
+                # Conexiones persistentes (keep-alive) hacia el proxy de RunPod
+                client_kwargs=self._http_client_kwargs(),
             )
             
             # Verificar conectividad con Ollama
@@ -116,17 +130,49 @@ class RAGSystem:
             logger.error(f"Y que el modelo '{self.model_name}' esté disponible")
             raise
     
+    def _http_client_kwargs(self) -> Dict[str, Any]:
+        """Parámetros del cliente httpx de Ollama: pool keep-alive y HTTP/2 si 'h2' está instalado."""
+        client_kwargs = {
+            "timeout": 120,
+            "limits": httpx.Limits(max_keepalive_connections=8, keepalive_expiry=60),
+        }
+        if importlib.util.find_spec("h2") is not None:
+            client_kwargs["http2"] = True
+        return client_kwargs
+    
+    def close(self) -> None:
+        """Cierra las conexiones HTTP abiertas hacia Ollama."""
+        ollama_client = getattr(self.llm, "_client", None)
+        http_client = getattr(ollama_client, "_client", None)
+        if http_client is not None:
+            try:
+                http_client.close()
+            except Exception as e:
+                logger.warning(f"No se pudo cerrar el cliente HTTP de Ollama: {e}")
+    
     def _setup_embeddings(self) -> HuggingFaceEmbeddings:
         """Configura el modelo de embeddings con optimizaciones."""
         device = 'cuda' if torch.cuda.is_available() else 'cpu'
         logger.info(f"Usando dispositivo para embeddings: {device}")
         
+        model_kwargs = {'device': device}
+        if device == 'cuda':
+            # En GPU, cargar los pesos directamente en FP16 (la normalización absorbe la pérdida de precisión)
+            model_kwargs['model_kwargs'] = {'torch_dtype': torch.float16}
+            logger.info("⚡ Modelo de embeddings en FP16")
+        
         try:
-            return HuggingFaceEmbeddings(
+            embeddings = HuggingFaceEmbeddings(
                 model_name="sentence-transformers/all-MiniLM-L6-v2",
-                model_kwargs={'device': device},
-                encode_kwargs={'normalize_embeddings': True}
+                model_kwargs=model_kwargs,
+                encode_kwargs={
+                    'normalize_embeddings': True,
+                    'convert_to_numpy': True,
+                    'batch_size': 128
+                }
             )
+            
+            return embeddings
         except Exception as e:
             logger.error(f"Error configurando embeddings: {e}")
             raise
@@ -157,9 +203,10 @@ class RAGSystem:
             
             logger.info(f"✅ Base vectorial cargada: {count} documentos en '{self.collection_name}'")
             
-            # Obtener documentos para BM25
-            stored_data = vectorstore.get()
-            self.docs = stored_data['documents'] if stored_data['documents'] else []
+            # Obtener documentos para BM25 por páginas (solo textos, sin metadatos)
+            self.docs = []
+            for batch in iter_stored_texts(vectorstore, total=count):
+                self.docs.extend(batch)
             
             if not self.docs:
                 logger.warning("No se encontraron documentos para BM25")
@@ -170,17 +217,36 @@ class RAGSystem:
             logger.error(f"Error cargando vectorstore: {e}")
             raise
     
-    def _setup_retriever(self) -> EnsembleRetriever:
+    def _setup_vector_retriever(self):
+        """Configura el recuperador vectorial según el backend elegido (Chroma o FAISS IVF-PQ)."""
+        if self.backend == "faiss_ivfpq":
+            try:
+                index_path = str(Path(self.chroma_dir) / f"{self.collection_name}.ivfpq")
+                index, ids = load_or_build_ivfpq_index(self.vectorstore, index_path)
+                logger.info("✅ Recuperador vectorial FAISS IVF-PQ configurado")
+                return FAISSRetriever(
+                    index=index,
+                    ids=ids,
+                    vectorstore=self.vectorstore,
+                    embed_model=self.embed_model,
+                    k=8
+                )
+            except Exception as e:
+                logger.warning(f"No se pudo usar FAISS IVF-PQ, se usa Chroma: {e}")
+        
+        return self.vectorstore.as_retriever(
+            search_type="similarity_score_threshold",
+            search_kwargs={
+                "k": 8,
+                "score_threshold": 0.3
+            }
+        )
+    
+    def _setup_retriever(self) -> NumpyEnsembleRetriever:
         """Configura el sistema de recuperación híbrida (vectorial + BM25)."""
         try:
             # Recuperador vectorial
-            vector_retriever = self.vectorstore.as_retriever(
-                search_type="similarity_score_threshold",
-                search_kwargs={
-                    "k": 8,
-                    "score_threshold": 0.3
-                }
-            )
+            vector_retriever = self._setup_vector_retriever()
             
             # Recuperador BM25 (solo si hay documentos)
             if self.docs:
@@ -188,7 +254,7 @@ class RAGSystem:
                 bm25_retriever.k = 8
                 
                 # Ensemble de ambos recuperadores
-                ensemble_retriever = EnsembleRetriever(
+                ensemble_retriever = NumpyEnsembleRetriever(
                     retrievers=[vector_retriever, bm25_retriever],
                     weights=[0.6, 0.4]  # Más peso al vectorial
                 )
@@ -233,7 +299,8 @@ class RAGSystem:
 
 **Respuesta basada en los documentos:**"""
 
-        prompt = PromptTemplate(
+        # Plantilla pre-dividida: se formatea por concatenación en cada consulta
+        prompt = PresplitPromptTemplate(
             template=prompt_template,
             input_variables=['context', 'question']
         )
@@ -370,7 +437,9 @@ class RAGSystemManager:
     
     @classmethod
     def clear_cache(cls):
-        """Limpia el cache de instancias."""
+        """Limpia el cache de instancias y cierra sus conexiones."""
+        for rag_system in cls._instances.values():
+            rag_system.close()
         cls._instances.clear()
         logger.info("🧹 Cache de sistemas RAG limpiado")
 
@@ -0,0 +1,291 @@
+"""
+Componentes compartidos por los motores RAG (`rag.py` y `ragS.py`).
+
+Contiene piezas de recuperación que no dependen del proveedor de LLM:
+- NumpyEnsembleRetriever: fusión RRF (Reciprocal Rank Fusion) vectorizada con NumPy
+- iter_stored_texts: lectura paginada de los textos almacenados en Chroma
+- FAISSRetriever / load_or_build_ivfpq_index: backend IVF-PQ opcional para colecciones grandes
+- PresplitPromptTemplate: plantilla de prompt pre-dividida para formatear por concatenación
+"""
+
+import json
+import logging
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    import faiss  # Dependencia opcional (faiss-cpu / faiss-gpu)
+except ImportError:
+    faiss = None
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.prompts import PromptTemplate
+from langchain_core.retrievers import BaseRetriever
+from pydantic import PrivateAttr
+
+logger = logging.getLogger(__name__)
+
+
+class NumpyEnsembleRetriever(BaseRetriever):
+    """
+    Recuperador híbrido que combina varios recuperadores mediante RRF ponderado.
+
+    Equivalente a `EnsembleRetriever` de LangChain, pero el cálculo de los
+    puntajes se hace en una sola expresión de NumPy en lugar de un bucle
+    de Python por documento.
+    """
+
+    retrievers: List[BaseRetriever]
+    weights: List[float]
+    c: int = 60  # Constante de suavizado del RRF (mismo valor que LangChain)
+    k: Optional[int] = None  # Máximo de documentos a devolver (None = todos)
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        """Consulta cada recuperador y fusiona sus resultados."""
+        results_per_retriever = [
+            retriever.invoke(
+                query,
+                config={"callbacks": run_manager.get_child(tag=f"retriever_{i + 1}")}
+            )
+            for i, retriever in enumerate(self.retrievers)
+        ]
+        return self._fuse(results_per_retriever, self.weights)
+
+    def _fuse(self, results_per_retriever: List[List[Document]], weights: List[float]) -> List[Document]:
+        """
+        Fusiona las listas de resultados con RRF ponderado.
+
+        Args:
+            results_per_retriever: Documentos devueltos por cada recuperador, en orden de ranking
+            weights: Peso de cada recuperador
+
+        Returns:
+            Documentos únicos ordenados por puntaje RRF descendente
+        """
+        # Asignar un índice de columna a cada documento único (por contenido)
+        doc_index: Dict[str, int] = {}
+        unique_docs: List[Document] = []
+        for docs in results_per_retriever:
+            for doc in docs:
+                if doc.page_content not in doc_index:
+                    doc_index[doc.page_content] = len(unique_docs)
+                    unique_docs.append(doc)
+
+        if not unique_docs:
+            return []
+
+        # Una entrada por aparición (recuperador, documento, ranking): un mismo texto repetido
+        # en una lista suma en cada aparición, como en EnsembleRetriever
+        rows, cols, ranks = [], [], []
+        for row, docs in enumerate(results_per_retriever):
+            for rank, doc in enumerate(docs, start=1):
+                rows.append(row)
+                cols.append(doc_index[doc.page_content])
+                ranks.append(rank)
+
+        weights_arr = np.asarray(weights, dtype=np.float64)
+        contributions = weights_arr[np.asarray(rows)] / (np.asarray(ranks, dtype=np.float64) + self.c)
+        scores = np.zeros(len(unique_docs))
+        np.add.at(scores, np.asarray(cols), contributions)
+
+        # Selección del top-k sin ordenar todo el arreglo cuando k es menor que N
+        if self.k is not None and self.k < len(unique_docs):
+            top = np.argpartition(-scores, self.k)[:self.k]
+            order = top[np.argsort(-scores[top], kind="stable")]
+        else:
+            order = np.argsort(-scores, kind="stable")
+
+        return [unique_docs[i] for i in order]
+
+
+def iter_stored_texts(vectorstore: Any, batch_size: int = 4096, total: Optional[int] = None) -> Iterator[List[str]]:
+    """
+    Recorre los textos de la colección de Chroma por páginas.
+
+    Solo pide el campo 'documents' (sin metadatos ni embeddings), de modo que
+    en memoria únicamente vive una página además de lo que acumule el llamador.
+
+    Args:
+        vectorstore: Instancia de Chroma (langchain_chroma)
+        batch_size: Tamaño de cada página
+        total: Número de documentos de la colección (se consulta si no se indica)
+
+    Yields:
+        Lista de textos de cada página
+    """
+    collection = vectorstore._collection
+    if total is None:
+        total = collection.count()
+
+    for offset in range(0, total, batch_size):
+        batch = collection.get(limit=batch_size, offset=offset, include=["documents"])
+        yield [text for text in batch["documents"] if text]
+
+
+class FAISSRetriever(BaseRetriever):
+    """
+    Recuperador vectorial sobre un índice FAISS IVF-PQ.
+
+    El índice solo guarda los códigos PQ; los textos y metadatos se leen de
+    Chroma por ID para los k resultados de cada consulta.
+    """
+
+    index: Any
+    ids: List[str]
+    vectorstore: Any
+    embed_model: Any
+    k: int = 8
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        """Busca los k vecinos más cercanos y recupera su contenido desde Chroma."""
+        query_vec = np.asarray([self.embed_model.embed_query(query)], dtype=np.float32)
+        _, positions = self.index.search(query_vec, self.k)
+        hit_ids = [self.ids[pos] for pos in positions[0] if pos >= 0]
+        if not hit_ids:
+            return []
+
+        data = self.vectorstore._collection.get(ids=hit_ids, include=["documents", "metadatas"])
+        by_id = {
+            doc_id: (text, metadata)
+            for doc_id, text, metadata in zip(data["ids"], data["documents"], data["metadatas"])
+        }
+        return [
+            Document(page_content=by_id[doc_id][0], metadata=by_id[doc_id][1] or {})
+            for doc_id in hit_ids if doc_id in by_id
+        ]
+
+
+def load_or_build_ivfpq_index(vectorstore: Any,
+                              index_path: str,
+                              nlist: int = 256,
+                              m: int = 48,
+                              nbits: int = 8,
+                              train_size: int = 10_000,
+                              nprobe: int = 16,
+                              batch_size: int = 4096) -> Tuple[Any, List[str]]:
+    """
+    Carga el índice IVF-PQ persistido o lo construye a partir de la colección de Chroma.
+
+    El índice se reconstruye si el número de vectores no coincide con la colección.
+    Los embeddings se leen por páginas: una primera pasada toma una muestra
+    aleatoria para entrenar y una segunda añade todos los vectores al índice.
+
+    Args:
+        vectorstore: Instancia de Chroma con los embeddings ya calculados
+        index_path: Ruta del archivo del índice (los IDs se guardan en '<ruta>.ids.json')
+        nlist: Número de listas invertidas (se reduce en colecciones pequeñas)
+        m: Número de subcuantizadores PQ (debe dividir la dimensión)
+        nbits: Bits por código PQ
+        train_size: Tamaño de la muestra de entrenamiento
+        nprobe: Listas visitadas por consulta
+        batch_size: Tamaño de página al leer Chroma
+
+    Returns:
+        Tupla (índice FAISS, IDs de Chroma en el orden del índice)
+
+    Raises:
+        ImportError: Si faiss no está instalado
+        ValueError: Si la colección es demasiado pequeña para entrenar PQ
+    """
+    if faiss is None:
+        raise ImportError("faiss no está instalado (pip install faiss-cpu)")
+
+    collection = vectorstore._collection
+    total = collection.count()
+    ids_path = Path(f"{index_path}.ids.json")
+
+    # Reutilizar el índice persistido si sigue al día
+    if Path(index_path).exists() and ids_path.exists():
+        index = faiss.read_index(index_path)
+        if index.ntotal == total:
+            index.nprobe = nprobe
+            ids = json.loads(ids_path.read_text(encoding="utf-8"))
+            logger.info(f"📂 Índice IVF-PQ cargado: {index.ntotal} vectores")
+            return index, ids
+
+    min_train = 2 ** nbits  # PQ necesita al menos un punto por centroide
+    if total < min_train:
+        raise ValueError(f"Se necesitan al menos {min_train} vectores para IVF-PQ (hay {total})")
+
+    def pages():
+        for offset in range(0, total, batch_size):
+            batch = collection.get(limit=batch_size, offset=offset, include=["embeddings"])
+            yield batch["ids"], np.asarray(batch["embeddings"], dtype=np.float32)
+
+    # Primera pasada: muestra aleatoria proporcional de cada página
+    rng = np.random.default_rng(0)
+    sample_ratio = min(1.0, train_size / total)
+    samples = []
+    for _, vectors in pages():
+        take = max(1, int(round(len(vectors) * sample_ratio)))
+        samples.append(vectors[rng.choice(len(vectors), size=min(take, len(vectors)), replace=False)])
+    train_vectors = np.ascontiguousarray(np.vstack(samples))
+
+    dim = train_vectors.shape[1]
+    while dim % m:
+        m -= 1  # m debe dividir la dimensión
+    nlist = max(1, min(nlist, len(train_vectors) // 39))
+
+    quantizer = faiss.IndexFlatIP(dim)
+    index = faiss.IndexIVFPQ(quantizer, dim, nlist, m, nbits, faiss.METRIC_INNER_PRODUCT)
+    index.train(train_vectors)
+    del train_vectors, samples
+
+    # Segunda pasada: añadir todos los vectores
+    ids: List[str] = []
+    for batch_ids, vectors in pages():
+        index.add(np.ascontiguousarray(vectors))
+        ids.extend(batch_ids)
+
+    index.nprobe = nprobe
+    faiss.write_index(index, index_path)
+    ids_path.write_text(json.dumps(ids), encoding="utf-8")
+    logger.info(f"✅ Índice IVF-PQ construido: {index.ntotal} vectores, nlist={nlist}, m={m}")
+    return index, ids
+
+
+class PresplitPromptTemplate(PromptTemplate):
+    """
+    PromptTemplate de contexto + pregunta que se formatea por concatenación.
+
+    La plantilla se divide una sola vez en prefijo, parte intermedia y sufijo
+    alrededor de '{context}' y '{question}', evitando el análisis de
+    `str.format` en cada consulta. Si la plantilla no tiene esa forma simple
+    (llaves escapadas, otro orden, variables parciales) se usa el formateo normal.
+    """
+
+    _parts: Optional[Tuple[str, str, str]] = PrivateAttr(default=None)
+
+    def __init__(self, **kwargs: Any):
+        super().__init__(**kwargs)
+        self._parts = self._split_template(self.template)
+
+    @staticmethod
+    def _split_template(template: str) -> Optional[Tuple[str, str, str]]:
+        """Divide la plantilla en (prefijo, intermedio, sufijo) o devuelve None si no es posible."""
+        if "{{" in template or "}}" in template:
+            return None
+        if template.count("{context}") != 1 or template.count("{question}") != 1:
+            return None
+
+        prefix, rest = template.split("{context}")
+        if "{question}" not in rest:
+            return None  # La pregunta aparece antes que el contexto
+        mid, suffix = rest.split("{question}")
+        if "{" in prefix + mid + suffix:
+            return None  # Hay otras variables en la plantilla
+        return prefix, mid, suffix
+
+    def format(self, **kwargs: Any) -> str:
+        """Formatea el prompt concatenando las partes precalculadas."""
+        if self._parts is None or self.partial_variables:
+            return super().format(**kwargs)
+        prefix, mid, suffix = self._parts
+        return prefix + str(kwargs["context"]) + mid + str(kwargs["question"]) + suffix
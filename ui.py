@@ -41,7 +41,7 @@ class UserInterface:
         """Inicializa los componentes de UI como barra lateral, carga de archivos y búsqueda"""
         self.sidebar_manager = SidebarManager(self.db, self.vs_manager, self.embed_model)
         self.file_upload_manager = FileUploadManager(self.db, self.file_manager, self.embed_model)
-        self.search_interface = SearchInterface(self.db, self.vs_manager)
+        self.search_interface = SearchInterface(self.db, self.vs_manager, self.embed_model)
         self.llm_interface = LlmInterface(self.db, self.vs_manager, self.embed_model)
 
     def _initialize_default_state(self):
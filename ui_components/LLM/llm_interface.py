@@ -1,7 +1,10 @@
 import streamlit as st
 from streamlit_mic_recorder import speech_to_text
 import asyncio
+import concurrent.futures
+import threading
 from datetime import datetime
+from functools import lru_cache
 from io import BytesIO
 import edge_tts
 from ragS import ask_question
@@ -10,6 +13,15 @@ from ragS import ask_question
 
 VOICE = "es-MX-DaliaNeural"
 DEFAULT_LANGUAGE = "es"
+TTS_TIMEOUT = 30  # Segundos máximos de espera por la síntesis de audio
+
+# Event loop persistente en un hilo daemon: evita crear y destruir un loop por mensaje
+_LOOP = asyncio.new_event_loop()
+threading.Thread(target=_LOOP.run_forever, name="tts-event-loop", daemon=True).start()
+
+
+class _EmptyAudioError(RuntimeError):
+    """Edge TTS no devolvió audio (se lanza para que el fallo no quede en la caché)."""
 
 
 class LlmInterface:
@@ -111,27 +123,50 @@ class LlmInterface:
 
     def generate_audio_sync(self, text: str, voice=VOICE, rate="+0%", pitch="+0Hz", volume="+0%"):
         """Genera audio desde texto usando Edge TTS de manera síncrona."""
+        # Normalizar espacios para que respuestas repetidas compartan la entrada de caché
+        normalized_text = " ".join(text.split())
+        if not normalized_text:
+            return None
+        
         try:
-            # Usar asyncio.run() solo para la generación de audio
-            audio_data = asyncio.run(self._generate_audio_async(text, voice, rate, pitch, volume))
-            return audio_data
+            return _cached_tts(normalized_text, voice, rate, pitch, volume)
+        except _EmptyAudioError:
+            return None  # Sin audio: la respuesta se muestra solo como texto, sin aviso
         except Exception as e:
             st.error(f"Error generando audio: {e}")
             return None
 
-    async def _generate_audio_async(self, text: str, voice=VOICE, rate="+0%", pitch="+0Hz", volume="+0%"):
-        """Método auxiliar asíncrono para generar audio."""
-        try:
-            communicate = edge_tts.Communicate(
-                text=text, voice=voice, rate=rate, pitch=pitch, volume=volume
-            )
-
-            audio_data = bytearray()
-            async for chunk in communicate.stream():
-                if chunk["type"] == "audio":
-                    audio_data.extend(chunk["data"])
 
-            return bytes(audio_data) if audio_data else None
-
-        except Exception as e:
-            return None
\ No newline at end of file
+async def _generate_audio_async(text: str, voice=VOICE, rate="+0%", pitch="+0Hz", volume="+0%"):
+    """Función auxiliar asíncrona para generar audio."""
+    try:
+        communicate = edge_tts.Communicate(
+            text=text, voice=voice, rate=rate, pitch=pitch, volume=volume
+        )
+
+        audio_data = bytearray()
+        async for chunk in communicate.stream():
+            if chunk["type"] == "audio":
+                audio_data.extend(chunk["data"])
+
+        return bytes(audio_data) if audio_data else None
+
+    except Exception as e:
+        return None
+
+
+@lru_cache(maxsize=256)
+def _cached_tts(normalized_text: str, voice: str, rate: str, pitch: str, volume: str) -> bytes:
+    """Sintetiza el audio en el event loop de fondo; los textos repetidos se sirven desde la caché LRU."""
+    future = asyncio.run_coroutine_threadsafe(
+        _generate_audio_async(normalized_text, voice, rate, pitch, volume), _LOOP
+    )
+    try:
+        audio_data = future.result(timeout=TTS_TIMEOUT)
+    except concurrent.futures.TimeoutError:
+        future.cancel()  # Detener la corrutina en el loop de fondo en lugar de dejarla corriendo
+        raise
+    if not audio_data:
+        # Lanzar en lugar de devolver None para no cachear fallos
+        raise _EmptyAudioError("Edge TTS no devolvió audio")
+    return audio_data
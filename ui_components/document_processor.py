@@ -1,17 +1,46 @@
 # Importación de bibliotecas y módulos necesarios:
 # - streamlit: Framework para crear interfaces web interactivas
-# - time: Para manejo de marcas temporales
+# - os: Para stat() y nombres de archivo sin construir objetos Path
+# - time: Para marcas temporales y para limitar la frecuencia de refresco de la UI
+# - concurrent.futures: Para procesar varios archivos en paralelo (hilos y procesos)
 # - typing: Para anotaciones de tipos (List, Dict)
-# - pathlib: Para manejo de rutas de archivos de manera multiplataforma
 # - Módulos personalizados para procesamiento de documentos, almacenamiento vectorial y base de datos
 import streamlit as st
+import os
 import time
-from typing import List, Dict
-from pathlib import Path
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Iterator, List, Optional, Tuple
 
-from document_processing import process_single_document
+from document_processing import parse_file
 from vector_store import VectorStoreManager
 from document_db import DocumentDB
+from embedding_cache import CachedEmbedder
+from ui_components.model_manager import embed_batch
+
+
+# Tipos cuyo parseo es CPU-bound en Python puro (retiene el GIL): se procesan en procesos hijos.
+# El resto (TXT) es sobre todo E/S y se procesa en hilos.
+PROCESS_POOL_TYPES = {'.pdf', '.docx'}
+
+# Procesos de parseo: pocos, porque cada uno carga sus propios loaders en memoria
+MAX_PARSE_PROCESSES = min(4, os.cpu_count() or 1)
+
+
+@st.cache_resource(show_spinner=False)
+def _get_process_pool() -> ProcessPoolExecutor:
+    """Pool de procesos de parseo, compartido entre sesiones y reruns (arrancar procesos es caro)
+    
+    Los procesos hijos ejecutan document_processing.parse_file: solo importan ese módulo
+    y sus loaders, no streamlit ni el modelo de embeddings.
+    """
+    return ProcessPoolExecutor(max_workers=MAX_PARSE_PROCESSES)
+
+
+def _discard_process_pool() -> None:
+    """Descarta el pool (p. ej. si un proceso murió) para que la siguiente llamada cree uno nuevo"""
+    _get_process_pool().shutdown(wait=False, cancel_futures=True)
+    _get_process_pool.clear()
 
 
 class DocumentProcessor:
@@ -37,9 +66,21 @@ class DocumentProcessor:
         """
         self.db = db  # Almacena la referencia a la base de datos de documentos
         self.embed_model = embed_model  # Modelo para generar embeddings
+        # Envoltorio con caché por contenido: los chunks ya embebidos no se recalculan
+        self.embedder = CachedEmbedder(embed_model) if embed_model else None
         self.vs_manager = VectorStoreManager()  # Gestor del almacén vectorial
     
-    def process_and_save_files(self, valid_files: List, file_details: List[Dict]) -> None:
+    # Número de chunks acumulados antes de volcarlos a ChromaDB y a la base de datos
+    FLUSH_CHUNKS = 1000
+    # Tamaño de lote al calcular embeddings (amortiza el coste por llamada al modelo)
+    EMBED_BATCH_SIZE = 128
+    # Número máximo de archivos parseándose a la vez (acota los resultados retenidos en memoria)
+    MAX_PENDING_FILES = 8
+    # Intervalo mínimo (segundos) entre actualizaciones de la barra de progreso
+    UI_UPDATE_INTERVAL = 0.1
+    
+    def process_and_save_files(self, valid_files: List, file_details: List[Dict],
+                               uploaded_files_state: Optional[List[Dict]] = None) -> None:
         """Procesa y guarda los archivos en un solo paso
         
         Método principal que orquesta todo el flujo de procesamiento
@@ -47,171 +88,289 @@ class DocumentProcessor:
         Args:
             valid_files: Lista de tuplas (ruta_archivo, tipo_archivo)
             file_details: Lista de diccionarios con metadatos de archivos
+            uploaded_files_state: Estado de archivos subidos que contiene a file_details;
+                si se indica, se persiste una sola vez al terminar
             
         Flujo:
             1. Verifica que el modelo de embeddings esté cargado
             2. Extrae rutas y tipos de archivos
-            3. Procesa documentos en lote
-            4. Almacena resultados en base vectorial
+            3. Procesa documentos en paralelo y los consume a medida que terminan
+            4. Vuelca los chunks a la base vectorial por lotes de FLUSH_CHUNKS
+            5. Actualiza el estado de los archivos indexados
             
         Manejo de errores:
             - Valida presencia de modelo de embeddings
             - Captura y muestra errores durante el procesamiento
+            
+        Notas:
+            - En memoria solo vive un lote de chunks, no el corpus completo
         """
         if not self.embed_model:
             st.error("Error: El modelo de embeddings no está cargado")
             return
         
+        # Archivos cuyo contenido (hash, tamaño) ya está indexado: no se reprocesan
+        hash_by_path = {f['path']: f.get('hash') for f in file_details}
+        unchanged_paths = [f[0] for f in valid_files if self._is_unchanged(f[0], hash_by_path.get(f[0]))]
+        if unchanged_paths:
+            st.info(f"{len(unchanged_paths)} archivo(s) sin cambios ya estaban indexados y se omiten")
+            skip = set(unchanged_paths)
+            valid_files = [f for f in valid_files if f[0] not in skip]
+        
         # Extracción de rutas y tipos de archivos para procesamiento
         file_paths = [f[0] for f in valid_files]  # Lista de rutas completas
         file_types = [f[1] for f in valid_files]  # Lista de extensiones/tipos
+        # Todos los archivos del lote comparten la misma marca temporal de carga
+        batch_upload_time = time.strftime("%Y-%m-%d %H:%M:%S")
         
         # Bloque de procesamiento con indicador visual
         with st.spinner("Procesando y guardando documentos..."):
-            processed_docs = self._process_documents(file_paths, file_types)
+            saved_paths = list(unchanged_paths)  # Archivos cuyos chunks ya están en ChromaDB
+            saved_chunks = 0
+            batch_docs, batch_paths = [], []
+            
+            processed = self._process_documents(file_paths, file_types, batch_upload_time) if file_paths else ()
+            for file_path, docs in processed:
+                batch_docs.extend(docs)
+                batch_paths.append(file_path)
+                
+                if len(batch_docs) >= self.FLUSH_CHUNKS:
+                    if self._save_to_vectorstore(batch_docs, batch_paths):
+                        saved_paths.extend(batch_paths)
+                        saved_chunks += len(batch_docs)
+                    batch_docs, batch_paths = [], []
+            
+            # Último lote parcial
+            if batch_docs and self._save_to_vectorstore(batch_docs, batch_paths):
+                saved_paths.extend(batch_paths)
+                saved_chunks += len(batch_docs)
+            del batch_docs, batch_paths
             
-            if processed_docs:
-                self._save_to_vectorstore(processed_docs, file_details, file_paths)
+            if saved_paths:
+                self._finish_processing(file_details, saved_paths, saved_chunks)
             else:
                 st.warning("No se pudieron procesar documentos correctamente")
+            
+            # Una sola escritura del estado con los cambios de estado ya aplicados en memoria
+            if uploaded_files_state is not None:
+                self.db.set_state("uploaded_files", uploaded_files_state)
     
-    def _process_documents(self, file_paths: List[str], file_types: List[str]) -> List:
+    def _process_documents(self, file_paths: List[str], file_types: List[str],
+                           upload_time: Optional[str] = None) -> Iterator[Tuple[str, List]]:
         """Procesa los documentos individualmente
         
         Args:
             file_paths: Lista de rutas de archivos a procesar
             file_types: Lista de tipos correspondientes a cada archivo
+            upload_time: Marca temporal del lote (se calcula aquí si no se indica)
             
-        Returns:
-            Lista de documentos procesados (normalmente objetos Document)
+        Yields:
+            Tuplas (ruta_archivo, documentos) a medida que termina cada archivo
             
         Efectos secundarios:
             - Muestra progreso en la interfaz
             - Muestra advertencias/errores durante el procesamiento
             
         Consideraciones:
-            - Procesamiento secuencial (podría optimizarse con threads para muchos archivos)
+            - PDF/DOCX se parsean en un pool de procesos (CPU-bound, el GIL impide escalar con hilos)
+            - TXT se procesa en un pool de hilos (dominado por E/S)
+            - Las actualizaciones de la interfaz se hacen solo desde el hilo principal
             - Manejo individual de cada archivo para evitar fallo total por error en uno
+            - Es un generador: los chunks de cada archivo se entregan sin acumularlos aquí
+            - Solo hay MAX_PENDING_FILES archivos en vuelo; se envía uno nuevo al consumir cada resultado
         """
-        processed_docs = []
         progress_bar = st.progress(0)  # Barra de progreso inicializada
         status_text = st.empty()  # Contenedor para texto de estado dinámico
+        total = len(file_paths)
+        if upload_time is None:
+            upload_time = time.strftime("%Y-%m-%d %H:%M:%S")
         
-        # Procesamiento iterativo de cada archivo
-        for i, (file_path, file_type) in enumerate(zip(file_paths, file_types)):
-            # Actualización de UI con progreso actual
-            status_text.text(f"Procesando archivo {i+1}/{len(file_paths)}: {Path(file_path).name}")
-            progress_bar.progress((i + 1) / len(file_paths))
+        # Envío de un trabajo por archivo: PDF/DOCX al pool de procesos, el resto al de hilos
+        process_pool = None
+        if any(file_type in PROCESS_POOL_TYPES for file_type in file_types):
+            process_pool = _get_process_pool()
+        
+        with ThreadPoolExecutor(max_workers=min(8, max(1, total))) as executor:
+            jobs = zip(file_paths, file_types)
+            pending = {}  # Future -> (ruta, pool), solo los archivos en curso
             
-            try:
-                # Obtención de metadatos y procesamiento del documento
-                file_metadata = self._get_file_metadata(file_path, file_type)
-                docs = process_single_document(file_path, file_type, additional_metadata=file_metadata)
-                
-                if docs:
-                    processed_docs.extend(docs)
-                else:
-                    st.warning(f"No se extrajeron documentos de {Path(file_path).name}")
+            def submit_next() -> None:
+                """Envía el siguiente archivo pendiente, si queda alguno"""
+                nonlocal process_pool
+                for file_path, file_type in jobs:
+                    if file_type not in PROCESS_POOL_TYPES:
+                        pending[executor.submit(parse_file, file_path, file_type, upload_time)] = (file_path, executor)
+                        return
+                    try:
+                        future = process_pool.submit(parse_file, file_path, file_type, upload_time)
+                    except BrokenProcessPool:
+                        # Un proceso hijo murió: se reemplaza el pool y se reintenta el envío
+                        _discard_process_pool()
+                        process_pool = _get_process_pool()
+                        future = process_pool.submit(parse_file, file_path, file_type, upload_time)
+                    pending[future] = (file_path, process_pool)
+                    return
+            
+            # Como mucho MAX_PENDING_FILES archivos en vuelo: el resultado de un Future vive
+            # en memoria hasta que se consume, así que no se envía todo de golpe
+            for _ in range(self.MAX_PENDING_FILES):
+                submit_next()
+            
+            # Recolección a medida que terminan (el orden no importa: los chunks se filtran por 'source')
+            last_ui = 0.0
+            done = 0
+            while pending:
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                while finished:
+                    future = finished.pop()
+                    file_path, pool = pending.pop(future)
+                    submit_next()  # Mantener ocupados los workers mientras se consume este resultado
+                    done += 1
+                    name = os.path.basename(file_path)
+                    # Actualización de UI con progreso actual, como mucho cada UI_UPDATE_INTERVAL
+                    # segundos (cada actualización es un mensaje al navegador)
+                    now = time.monotonic()
+                    if now - last_ui >= self.UI_UPDATE_INTERVAL or done == total:
+                        status_text.text(f"Procesado archivo {done}/{total}: {name}")
+                        progress_bar.progress(done / total)
+                        last_ui = now
+                    
+                    try:
+                        docs = future.result()
+                    except Exception as e:
+                        if isinstance(e, BrokenProcessPool) and pool is process_pool:
+                            _discard_process_pool()
+                            process_pool = _get_process_pool()
+                        st.error(f"Error al procesar archivo {name}: {str(e)}")
+                        continue  # Continúa con siguiente archivo tras error
+                    finally:
+                        del future  # Sin referencias al Future, su resultado se libera al consumirse
                     
-            except Exception as e:
-                st.error(f"Error al procesar archivo {Path(file_path).name}: {str(e)}")
-                continue  # Continúa con siguiente archivo tras error
+                    if docs:
+                        yield file_path, docs
+                    else:
+                        st.warning(f"No se extrajeron documentos de {name}")
+                    del docs
         
         # Limpieza de elementos de UI al finalizar
         status_text.empty()
         progress_bar.empty()
-        return processed_docs
     
-    def _get_file_metadata(self, file_path: str, file_type: str) -> Dict:
-        """Genera metadatos para el archivo
+    def _is_unchanged(self, file_path: str, content_hash: Optional[str]) -> bool:
+        """Indica si el contenido del archivo ya fue indexado (con esta u otra ruta)
         
-        Args:
-            file_path: Ruta completa del archivo
-            file_type: Tipo/extensión del archivo
-            
-        Returns:
-            Diccionario con metadatos estandarizados:
-            - source: Ruta completa
-            - file_name: Nombre del archivo
-            - file_type: Tipo/extensión
-            - upload_time: Marca temporal
-            - file_size: Tamaño en KB
-            
-        Notas:
-            - Usa pathlib para manejo seguro de rutas
-            - Formatea el tamaño para legibilidad
+        Compara la huella (hash MD5 del contenido, tamaño en bytes) con las registradas en la BD.
+        El archivo temporal se reescribe en cada rerun, así que la fecha de modificación no sirve.
         """
-        return {
-            'source': file_path,
-            'file_name': Path(file_path).name,
-            'file_type': file_type,
-            'upload_time': time.strftime("%Y-%m-%d %H:%M:%S"),
-            'file_size': f"{Path(file_path).stat().st_size / 1024:.2f} KB"
-        }
+        if not content_hash:
+            return False
+        try:
+            size = os.stat(file_path).st_size
+        except OSError:
+            return False  # Si no se puede leer, se deja que el procesamiento informe el error
+        return self.db.get_document_by_fingerprint(content_hash, size) is not None
     
-    def _save_to_vectorstore(self, processed_docs: List, file_details: List[Dict], file_paths: List[str]):
-        """Guarda los documentos procesados en ChromaDB y actualiza estados
+    def _save_to_vectorstore(self, processed_docs: List, file_paths: List[str]) -> bool:
+        """Guarda un lote de documentos procesados en ChromaDB y en la base de datos
         
         Args:
-            processed_docs: Lista de documentos procesados
-            file_details: Metadatos de los archivos originales
-            file_paths: Rutas de los archivos procesados
+            processed_docs: Lista de documentos procesados del lote
+            file_paths: Rutas de los archivos incluidos en el lote
             
-        Flujo:
-            1. Almacena documentos en ChromaDB
-            2. Actualiza estado en base de datos
-            3. Muestra estadísticas de éxito
+        Returns:
+            True si el lote quedó almacenado en ChromaDB
             
         Manejo de errores:
             - Captura errores durante almacenamiento
             - Muestra mensaje detallado en UI
         """
         try:
+            # Embeddings calculados por lotes explícitos y entregados ya hechos a ChromaDB
+            vectors = self._embed_in_batches([doc.page_content for doc in processed_docs])
+            
             # Persistencia en almacén vectorial
-            vectorstore = self.vs_manager.save_to_chroma(processed_docs, self.embed_model)
+            self.vs_manager.save_to_chroma(processed_docs, self.embedder, embeddings=vectors)
+        except Exception as e:
+            st.error(f"Error al guardar en el almacén vectorial: {str(e)}")
+            return False
+        
+        # Persistencia de chunks en base de datos
+        #self._save_chunks_to_db(file_paths, processed_docs)
+        return True
+    
+    def _embed_in_batches(self, texts: List[str]) -> List[List[float]]:
+        """Calcula los embeddings de los textos en lotes de EMBED_BATCH_SIZE
+        
+        Args:
+            texts: Textos de los chunks, en el mismo orden que los documentos
+            
+        Returns:
+            Lista de vectores alineada con `texts`
+            
+        Notas:
+            - Cada texto distinto se embebe una sola vez (cabeceras, pies de página
+              y páginas repetidas comparten vector)
+            - Los lotes agrupan textos de longitud similar para reducir el padding
+        """
+        # Índice de cada texto único en orden de aparición
+        unique_index = {}
+        unique_texts = []
+        for text in texts:
+            if text not in unique_index:
+                unique_index[text] = len(unique_texts)
+                unique_texts.append(text)
+        
+        unique_vectors = embed_batch(self.embedder, unique_texts, batch_size=self.EMBED_BATCH_SIZE)
+        
+        # Reparto del vector de cada texto único a todas sus apariciones
+        return [unique_vectors[unique_index[text]] for text in texts]
+    
+    def _finish_processing(self, file_details: List[Dict], file_paths: List[str], total_chunks: int):
+        """Actualiza estados y muestra estadísticas al terminar todos los lotes
+        
+        Args:
+            file_details: Metadatos de los archivos originales
+            file_paths: Rutas de los archivos indexados correctamente
+            total_chunks: Número de chunks guardados en esta carga
+        """
+        try:
             self.db.set_state("vectorstore_exists", True)
+            # Nueva versión del almacén: invalida las búsquedas cacheadas
+            self.db.increment_state("vectorstore_version")
             
-            # Actualización de estados en UI y base de datos
-            self._update_file_status(file_details, file_paths, processed_docs)
+            # Actualización de estados en UI y base de datos (solo archivos indexados)
+            indexed = set(file_paths)
+            self._update_file_status([f for f in file_details if f["path"] in indexed])
             
             # Feedback visual de éxito con estadísticas
             stats = self.vs_manager.get_document_stats()
             st.success(
-                f"Procesados y guardados {len(processed_docs)} chunks de {len(file_paths)} documentos. "
+                f"Procesados y guardados {total_chunks} chunks de {len(file_paths)} documentos. "
                 f"Total chunks: {stats.get('total_chunks', 0)}"
             )
             
         except Exception as e:
             st.error(f"Error en la finalización del procesamiento: {str(e)}")
     
-    def _update_file_status(self, file_details: List[Dict], file_paths: List[str], processed_docs: List):
+    def _update_file_status(self, file_details: List[Dict]):
         """Actualiza el estado de los archivos procesados
         
         Args:
-            file_details: Lista de metadatos de archivos
-            file_paths: Rutas de archivos procesados
-            processed_docs: Documentos resultantes
+            file_details: Lista de metadatos de archivos indexados
             
         Efectos:
-            - Actualiza estado a "Indexado" en UI
+            - Actualiza estado a "Indexado" en memoria (las mismas entradas del estado de UI)
             - Persiste estado en base de datos
-            - Almacena chunks procesados
             
         Notas:
-            - Maneja errores individuales por archivo
-            - Mantiene consistencia entre UI y base de datos
+            - El estado de UI se guarda una sola vez al final de process_and_save_files
         """
         # Actualización de estado en memoria para UI
-        uploaded_files_state = self.db.get_state("uploaded_files", [])
         for file in file_details:
             file["status"] = "Indexado"
-            
-            try:
-                self.db.update_document_status(file["path"], "Indexado")
-            except Exception as db_error:
-                st.error(f"Error al actualizar estado en BD: {str(db_error)}")
         
-        self.db.set_state("uploaded_files", uploaded_files_state)
-        
-        # Persistencia de chunks en base de datos
-        #self._save_chunks_to_db(file_paths, processed_docs)
\ No newline at end of file
+        # Actualización de todos los estados en una sola transacción
+        try:
+            self.db.update_document_statuses_bulk([f["path"] for f in file_details], "Indexado")
+        except Exception as db_error:
+            st.error(f"Error al actualizar estado en BD: {str(db_error)}")
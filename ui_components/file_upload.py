@@ -3,10 +3,12 @@
 # - typing: Para anotaciones de tipos (List, Dict)
 # - file_manager: Módulo personalizado para manejo de archivos
 # - document_db: Módulo personalizado para gestión de base de datos de documentos
+# - document_processor: Procesamiento e indexación de los archivos subidos
 import streamlit as st
 from typing import List, Dict
 from file_manager import FileManager
 from document_db import DocumentDB
+from ui_components.document_processor import DocumentProcessor
 
 
 class FileUploadManager:
@@ -36,6 +38,20 @@ class FileUploadManager:
         self.file_manager = file_manager  # Gestor de operaciones con archivos
         self.embed_model = embed_model  # Modelo para generación de embeddings
     
+    @property
+    def processor(self) -> DocumentProcessor:
+        """Procesador de documentos de la sesión
+        
+        FileUploadManager se reconstruye en cada rerun, así que el procesador se guarda
+        en st.session_state: se crea en el primer clic y se reutiliza en los siguientes
+        mientras el modelo de embeddings sea el mismo.
+        """
+        processor = st.session_state.get('_document_processor')
+        if processor is None or processor.embed_model is not self.embed_model:
+            processor = DocumentProcessor(self.db, self.embed_model)
+            st.session_state['_document_processor'] = processor
+        return processor
+    
     def show_file_upload(self):
         """Muestra la interfaz para carga de archivos
         
@@ -57,8 +73,12 @@ class FileUploadManager:
         uploaded_files_state = self.db.get_state("uploaded_files", [])
         
         # Limpieza de archivos temporales de cargas previas
-        # Evita acumulación de archivos no procesados
-        self.file_manager.clean_temp_files(uploaded_files_state)
+        # Evita acumulación de archivos no procesados; solo se recorre el directorio
+        # cuando algo cambió desde la última limpieza (no en cada rerun)
+        st.session_state.setdefault('_temp_dirty', True)
+        if st.session_state['_temp_dirty']:
+            self.file_manager.clean_temp_files(uploaded_files_state)
+            st.session_state['_temp_dirty'] = False
         
         # Widget de Streamlit para carga de archivos:
         # - Soporta múltiples archivos
@@ -105,24 +125,31 @@ class FileUploadManager:
         
         # Si hay archivos válidos, registrar en la base de datos
         if file_details:
-            # Registrar cada archivo en la base de datos
-            for file in file_details:
-                # Insertar documento con sus metadatos básicos
-                doc_id = self.db.add_document(
+            # Registrar todos los archivos en la base de datos en una sola transacción
+            doc_ids = self.db.add_documents_bulk([
+                (
                     file['path'],  # Ruta física del archivo
                     file['type'],  # Tipo/extensión del archivo
-                    metadata={
+                    {
                         'name': file['name'],  # Nombre original
                         'size': file['size'],  # Tamaño del archivo
+                        'hash': file['hash'],  # Hash del contenido (huella de indexación)
                         'upload_time': file['upload_time']  # Marca temporal
                     }
                 )
+                for file in file_details
+            ])
+            for file, doc_id in zip(file_details, doc_ids):
                 file['doc_id'] = doc_id  # Guardar ID asignado
             
             # Actualizar estado global de archivos subidos
             uploaded_files_state.extend(file_details)
             self.db.set_state("uploaded_files", uploaded_files_state)
         
+        # Hay archivos temporales nuevos: revisar el directorio en el próximo rerun
+        if valid_files:
+            st.session_state['_temp_dirty'] = True
+        
         return valid_files, file_details
     
     def _show_upload_interface(self, valid_files, file_details, uploaded_files_state):
@@ -139,31 +166,26 @@ class FileUploadManager:
             3. Inicia procesamiento al hacer click
             
         Consideraciones:
-            - Importación dinámica de DocumentProcessor para evitar circular imports
+            - Reutiliza una única instancia de DocumentProcessor entre clics
             - Deshabilita botón si no hay modelo de embeddings cargado
         """
-        # Determinar qué archivos mostrar en vista previa:
-        # Prioriza los nuevos, sino muestra pendientes del estado actual
-        files_to_preview = file_details if file_details else [
-            f for f in uploaded_files_state 
-            if f['status'] == 'Pendiente' and f['path'] in [vf[0] for vf in valid_files]
+        # Rutas válidas como conjunto: búsqueda O(1) por archivo del estado
+        valid_path_set = {vf[0] for vf in valid_files}
+        
+        # Determinar qué archivos mostrar en vista previa y procesar:
+        # Prioriza los nuevos, sino usa los pendientes del estado actual
+        files_to_show = file_details or [
+            f for f in uploaded_files_state
+            if f['status'] == 'Pendiente' and f['path'] in valid_path_set
         ]
         # Mostrar vista previa usando FileManager
-        self.file_manager.show_file_preview(files_to_preview)
+        self.file_manager.show_file_preview(files_to_show)
         
         # Botón de procesamiento con estado condicional:
         # - Deshabilitado si no hay modelo de embeddings
         # - Estilo primario para destacar acción principal
         if st.button("Procesar y Guardar", disabled=not self.embed_model):
-            # Determinar qué archivos procesar (similar a vista previa)
-            files_to_process = file_details if file_details else [
-                f for f in uploaded_files_state 
-                if f['status'] == 'Pendiente' and f['path'] in [vf[0] for vf in valid_files]
-            ]
-            
-            # Importación dinámica para evitar dependencia circular:
-            # DocumentProcessor también podría necesitar FileUploadManager
-            from ui_components.document_processor import DocumentProcessor
-            # Crear instancia del procesador y ejecutar
-            processor = DocumentProcessor(self.db, self.embed_model)
-            processor.process_and_save_files(valid_files, files_to_process)
\ No newline at end of file
+            # El procesador se crea en el primer clic y se reutiliza después
+            self.processor.process_and_save_files(valid_files, files_to_show, uploaded_files_state)
+            # Los archivos indexados ya pueden eliminarse del directorio temporal
+            st.session_state['_temp_dirty'] = True
\ No newline at end of file
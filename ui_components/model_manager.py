@@ -1,10 +1,75 @@
 # Importación de bibliotecas y módulos necesarios:
 # - streamlit: Framework para crear interfaces web interactivas
+# - os: Para leer la configuración del modelo desde variables de entorno
+# - torch: Para detectar CUDA y para la cuantización dinámica int8 en CPU
 # - vector_store: Módulo personalizado para gestión de almacenes vectoriales
+import os
 import streamlit as st
+import torch
 from vector_store import VectorStoreManager
 
 
+def _load_with_backend(vs_manager: VectorStoreManager, model_name: str, backend: str):
+    """Carga el modelo con el backend indicado, volviendo a PyTorch si no está disponible
+    
+    El backend ONNX Runtime ejecuta el grafo exportado (con fusión de operaciones y
+    kernels SIMD) y suele ser bastante más rápido que PyTorch en CPU para MiniLM.
+    """
+    if backend != 'torch':
+        try:
+            return vs_manager.setup_embeddings(model_name, backend=backend)
+        except Exception as e:
+            # Falta optimum/onnxruntime o el modelo no tiene exportación: seguir con PyTorch
+            print(f"Backend '{backend}' no disponible ({e}); usando PyTorch")
+    return vs_manager.setup_embeddings(model_name)
+
+
+def _quantize_int8(embed_model) -> bool:
+    """Cuantiza a int8 las capas lineales del modelo de embeddings (solo CPU)
+    
+    Usa cuantización dinámica de PyTorch sobre el modelo de transformers que
+    envuelve SentenceTransformer: reduce a la mitad la memoria de los pesos y
+    acelera la inferencia en CPU con una pérdida de calidad despreciable.
+    
+    Returns:
+        True si se aplicó la cuantización
+    """
+    client = getattr(embed_model, '_client', None) or getattr(embed_model, 'client', None)
+    if client is None or client.device.type != 'cpu':
+        return False  # Los kernels cuantizados de PyTorch solo existen para CPU
+    
+    transformer = client[0].auto_model
+    if not isinstance(transformer, torch.nn.Module):
+        return False  # Backend ONNX/OpenVINO: no hay capas de PyTorch que cuantizar
+    torch.quantization.quantize_dynamic(transformer, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+    return True
+
+
+def embed_batch(embed_model, texts: list, batch_size: int = 64) -> list:
+    """Calcula embeddings por lotes agrupando textos de longitud parecida
+    
+    Los textos se ordenan por longitud antes de partirlos en lotes, así cada
+    lote se rellena (padding) hasta una longitud similar y se desperdicia
+    menos cómputo. El resultado se devuelve en el orden original.
+    
+    Args:
+        embed_model: Modelo con método embed_documents
+        texts: Textos a embeber
+        batch_size: Número de textos por llamada al modelo
+        
+    Returns:
+        Lista de vectores alineada con `texts`
+    """
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+    vectors = [None] * len(texts)
+    for start in range(0, len(order), batch_size):
+        batch_idx = order[start:start + batch_size]
+        batch_vectors = embed_model.embed_documents([texts[i] for i in batch_idx])
+        for i, vector in zip(batch_idx, batch_vectors):
+            vectors[i] = vector
+    return vectors
+
+
 @st.cache_resource  # Decorador de Streamlit para cachear recursos costosos
 def load_embedding_model():
     """Función cacheada para cargar el modelo una sola vez
@@ -24,6 +89,8 @@ def load_embedding_model():
         
     Notas:
         - Usa el modelo 'all-MiniLM-L6-v2' de Sentence Transformers
+        - Backend ONNX Runtime por defecto en CPU y PyTorch FP16 en CUDA (EMBED_BACKEND lo fuerza)
+        - Con PyTorch en CPU se cuantiza a int8 salvo que EMBED_INT8=0
         - La caché se mantiene mientras la app esté en ejecución
     """
     vs_manager = VectorStoreManager()  # Instancia del gestor de almacén vectorial
@@ -33,7 +100,12 @@ def load_embedding_model():
         # Bloque de carga con feedback visual
         with st.spinner(f"🔍 Cargando modelo all-MiniLM-L6-v2 (solo una vez)..."):
             # Configura el modelo de embeddings a través del VectorStoreManager
-            embed_model = vs_manager.setup_embeddings(model_name)
+            # ONNX por defecto solo en CPU; en GPU, PyTorch con pesos FP16
+            default_backend = 'torch' if torch.cuda.is_available() else 'onnx'
+            embed_model = _load_with_backend(vs_manager, model_name, os.getenv('EMBED_BACKEND', default_backend))
+            # Cuantización int8 en CPU para el backend torch (desactivable con EMBED_INT8=0)
+            if os.getenv('EMBED_INT8', '1') == '1' and _quantize_int8(embed_model):
+                print(f"Modelo {model_name} cuantizado a int8")
             print(f"Modelo {model_name} cargado correctamente")  # Log para depuración
             return embed_model
     except Exception as e:
@@ -8,6 +8,22 @@ from pathlib import Path
 from vector_store import VectorStoreManager
 from document_db import DocumentDB
 
+# Resultados renderizados por página y caracteres del contenido mostrados por defecto
+RESULTS_PAGE_SIZE = 3
+PREVIEW_CHARS = 500
+
+
+@st.cache_data(show_spinner=False, max_entries=256)
+def _cached_search(query: str, k: int, version: int, _vs_manager: VectorStoreManager, _embed_model=None):
+    """Búsqueda semántica cacheada por (consulta, k, versión del almacén)
+    
+    Los reruns de la página (expandir un resultado, "Mostrar más") no vuelven a
+    embeber la consulta ni a recorrer el índice. `version` cambia cada vez que se
+    indexan documentos nuevos; `_vs_manager` y `_embed_model` (el modelo ya cargado
+    por la app) no forman parte de la clave.
+    """
+    return _vs_manager.similarity_search(query, k=k, embed_model=_embed_model)
+
 
 class SearchInterface:
     """Maneja la interfaz de búsqueda semántica
@@ -23,15 +39,17 @@ class SearchInterface:
     - Asume que el almacén vectorial ya contiene documentos indexados
     """
     
-    def __init__(self, db: DocumentDB, vs_manager: VectorStoreManager):
+    def __init__(self, db: DocumentDB, vs_manager: VectorStoreManager, embed_model=None):
         """Inicializa la interfaz de búsqueda
         
         Args:
             db (DocumentDB): Instancia de la base de datos para acceder a estados y metadatos
             vs_manager (VectorStoreManager): Gestor del almacén vectorial para realizar búsquedas
+            embed_model: Modelo de embeddings ya cargado, para embeber las consultas sin recargarlo
         """
         self.db = db  # Almacena referencia a la base de datos de documentos
         self.vs_manager = vs_manager  # Gestor del almacén vectorial
+        self.embed_model = embed_model  # Modelo compartido con el resto de la app
     
     def show_search_interface(self) -> None:
         """Muestra la interfaz de búsqueda
@@ -110,18 +128,24 @@ class SearchInterface:
             
         Flujo:
             1. Muestra spinner durante la operación
-            2. Delega la búsqueda al VectorStoreManager
+            2. Delega la búsqueda al VectorStoreManager (o la sirve desde la caché)
             3. Muestra resultados o errores
             
         Manejo de errores:
             - Captura excepciones durante la búsqueda
             - Muestra mensaje de error claro al usuario
         """
+        # Nueva consulta: volver a mostrar solo la primera página de resultados
+        if st.session_state.get('_shown_for') != (query, k):
+            st.session_state['_shown_for'] = (query, k)
+            st.session_state['_shown_k'] = RESULTS_PAGE_SIZE
+        
         # Bloque de búsqueda con feedback visual
         with st.spinner("Buscando..."):
             try:
-                # Ejecuta búsqueda semántica en el almacén vectorial
-                results = self.vs_manager.similarity_search(query, k=k)
+                # Ejecuta búsqueda semántica en el almacén vectorial (cacheada por versión)
+                version = self.db.get_state("vectorstore_version", 0)
+                results = _cached_search(query, k, version, self.vs_manager, self.embed_model)
                 # Muestra resultados formateados
                 self._display_search_results(results)
                 
@@ -144,11 +168,14 @@ class SearchInterface:
             - Usa expanders para evitar saturar la pantalla
             - Muestra score de similitud con 2 decimales
             - Extrae nombre de archivo legible de la ruta
+            - Renderiza los resultados por páginas ("Mostrar más")
+            - Trunca el contenido a PREVIEW_CHARS caracteres salvo que se pida verlo completo
         """
         st.subheader("Resultados")  # Encabezado de sección
+        shown = st.session_state.setdefault('_shown_k', RESULTS_PAGE_SIZE)
         
-        # Iteración sobre resultados con índice
-        for i, (doc, score) in enumerate(results):
+        # Iteración sobre la página visible de resultados
+        for i, (doc, score) in enumerate(results[:shown]):
             # Extracción y formateo del nombre de archivo
             source_path = doc.metadata.get('source', '')
             file_name = Path(source_path).name if source_path else 'Desconocido'
@@ -157,5 +184,15 @@ class SearchInterface:
             with st.expander(f"Resultado #{i+1} (Similitud: {score:.2f}) - {file_name}"):
                 # Metadatos del documento
                 st.write(f"**Página:** {doc.metadata.get('page', 'N/A')}")
-                # Contenido principal con formato
-                st.write(f"**Contenido:**\n{doc.page_content}")
\ No newline at end of file
+                # Contenido principal con formato (recortado si es largo)
+                content = doc.page_content
+                if len(content) > PREVIEW_CHARS and not st.toggle("Ver completo", key=f"_full_result_{i}"):
+                    content = content[:PREVIEW_CHARS] + "..."
+                st.write(f"**Contenido:**\n{content}")
+        
+        # Resto de resultados bajo demanda
+        if shown < len(results):
+            st.button(
+                "Mostrar más",
+                on_click=lambda: st.session_state.update(_shown_k=shown + RESULTS_PAGE_SIZE)
+            )
@@ -7,6 +7,33 @@ from vector_store import VectorStoreManager
 from document_db import DocumentDB
 
 
+@st.cache_data(show_spinner=False, ttl=60)
+def _cached_vectorstore_stats(version: int, _vs_manager: VectorStoreManager):
+    """Estadísticas del almacén vectorial cacheadas por versión del almacén
+    
+    La barra lateral se vuelve a ejecutar en cada rerun; así solo se consulta
+    ChromaDB cuando `version` cambia (nuevos documentos indexados) o vence el TTL.
+    `_vs_manager` no forma parte de la clave.
+    
+    Returns:
+        dict con las estadísticas, o None si no hay colección con documentos
+    """
+    if not _vs_manager.collection_exists():
+        return None
+    return _vs_manager.get_document_stats()
+
+
+@st.cache_data(show_spinner=False, ttl=30)
+def _cached_document_stats(version: int, _db: DocumentDB):
+    """Estadísticas de DocumentDB cacheadas por 'documents_version'
+    
+    `version` cambia cada vez que se añaden, eliminan o cambian de estado documentos;
+    `_db` no forma parte de la clave.
+    """
+    return _db.get_document_stats()
+
+
+
 class SidebarManager:
     """Maneja la barra lateral con configuración y estadísticas
     
@@ -98,8 +125,9 @@ class SidebarManager:
             - El directorio está hardcodeado por simplicidad
             - El nombre de colección se persiste entre sesiones
         """
-        # Configuración fija del directorio de ChromaDB
-        self.db.set_state("chroma_dir", "chroma_dir")
+        # Configuración fija del directorio de ChromaDB (solo se escribe si cambió, no en cada rerun)
+        if self.db.get_state("chroma_dir") != "chroma_dir":
+            self.db.set_state("chroma_dir", "chroma_dir")
         
         # Input para nombre de colección con valor actual o por defecto
         #collection_name = st.text_input(
@@ -108,7 +136,8 @@ class SidebarManager:
         #)
         # Persistencia del nuevo valor en el estado
         collection_name = "document_collection"
-        self.db.set_state("collection_name", collection_name)
+        if self.db.get_state("collection_name") != collection_name:
+            self.db.set_state("collection_name", collection_name)
 
     def _show_statistics(self):
         """Muestra estadísticas del vectorstore
@@ -127,17 +156,20 @@ class SidebarManager:
             - Solo muestra estadísticas si hay datos indexados
             - Combina métricas de DocumentDB y VectorStoreManager
         """
+        # Estadísticas del almacén vectorial, cacheadas por versión (sin IO de ChromaDB en reruns)
+        version = self.db.get_state("vectorstore_version", 0)
+        stats = _cached_vectorstore_stats(version, self.vs_manager)
+        
         # Verificación de existencia del vectorstore (en estado o directamente en ChromaDB)
         vectorstore_exists = (
             self.db.get_state("vectorstore_exists", False)  # Estado en DocumentDB
-            or self.vs_manager.collection_exists()  # Verificación directa en ChromaDB
+            or stats is not None  # Verificación (cacheada) en ChromaDB
         )
         
         # Solo mostrar estadísticas si existe el vectorstore
         if vectorstore_exists:
-            # Obtención de estadísticas de diferentes fuentes
-            stats = self.vs_manager.get_document_stats()  # Del almacén vectorial
-            db_stats = self.db.get_document_stats()  # De la base de datos de documentos
+            # Estadísticas de la base de datos, cacheadas hasta que se añadan o eliminen documentos
+            db_stats = _cached_document_stats(self.db.get_state("documents_version", 0), self.db)
             
             # Renderizado de las métricas
             st.subheader("📊 Estadísticas")
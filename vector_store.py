@@ -1,87 +1,155 @@
+import gc
 import os
+import sys
+import time
+import uuid
 import warnings
 import logging
 from typing import List, Dict, Optional
 from pathlib import Path
+from datetime import datetime
 import shutil
+import sqlite3
 
 # Suprimir advertencias específicas de PyTorch/ChromaDB
 warnings.filterwarnings("ignore", message=".*torch.classes.*")
 warnings.filterwarnings("ignore", category=UserWarning, module="chromadb")
 
-# Configurar logging para suprimir mensajes de ChromaDB
+# Advertencias de PyTorch que no afectan la funcionalidad: se silencian una sola vez
+# al importar el módulo, salvo que el usuario haya configurado -W
+if not sys.warnoptions:
+    warnings.simplefilter("ignore", category=UserWarning)
+
+# Configurar logging y variables de entorno para suprimir mensajes de ChromaDB
 logging.getLogger("chromadb").setLevel(logging.ERROR)
+os.environ.setdefault("CHROMA_LOG_LEVEL", "ERROR")
 
+import chromadb
 from langchain_core.documents import Document
 from langchain_core.embeddings import Embeddings
-from langchain_chroma import Chroma
 from langchain_huggingface import HuggingFaceEmbeddings
 
+import numpy as np
 import torch
 
+# Con embeddings normalizados el producto interno equivale a la similitud coseno,
+# así que HNSW puede usar "ip" y evitar la normalización por comparación
+IP_COLLECTION_METADATA = {"hnsw:space": "ip"}
+
+# Parámetros del grafo HNSW de Chroma: más vecinos por nodo y mayor ef de construcción
+# mejoran el recall; ef de búsqueda acotado mantiene la latencia por consulta
+HNSW_PARAMS = {
+    "hnsw:M": 32,
+    "hnsw:construction_ef": 200,
+    "hnsw:search_ef": 64,
+}
+
+# Campos de metadatos filtrables en similarity_search(where=...), indexados en SQLite
+CHUNK_META_FIELDS = ("document_name", "document_type", "batch_id")
+
+# Con hasta este número de candidatos el filtro se resuelve con un recorrido exacto sobre
+# sus vectores (un producto matriz-vector); por encima sale más barato pedir a HNSW
+# más resultados de los necesarios y quedarse con los que pasan el filtro
+FILTER_EXACT_MAX_CANDIDATES = 2000
+
 
 class VectorStoreManager:
     def __init__(self, chroma_dir: str = "BD/chroma_db_dir", collection_name: str = "document_collection"):
         """Inicializa el manejador del vectorstore, definiendo el directorio de persistencia y el nombre de la colección."""
         self.chroma_dir = chroma_dir
         self.collection_name = collection_name
-        self.vectorstore: Optional[Chroma] = None
-        
-        # Suprimir advertencias específicas durante la inicialización
-        self._suppress_torch_warnings()
-
-    def _suppress_torch_warnings(self):
-        """Suprime advertencias específicas de PyTorch que no afectan la funcionalidad."""
-        import sys
-        if not sys.warnoptions:
-            warnings.simplefilter("ignore", category=UserWarning)
-        
-        # Configurar variables de entorno para suprimir advertencias de ChromaDB
-        os.environ.setdefault("CHROMA_LOG_LEVEL", "ERROR")
+        # Cliente nativo de chromadb y colección, abiertos una sola vez por gestor
+        self._client: Optional[chromadb.ClientAPI] = None
+        self.collection: Optional[chromadb.Collection] = None
+        # Resultado cacheado de collection_exists (se invalida en las operaciones que modifican la colección)
+        self._exists_cache: Optional[bool] = None
+        # Modelo de embeddings cacheado (se carga una sola vez)
+        self._embed_model: Optional[HuggingFaceEmbeddings] = None
+        self._embed_model_key: Optional[tuple] = None
+        # Índice SQLite de metadatos filtrables: el esquema se crea una vez, aquí
+        self._create_meta_index()
+
+    def setup_embeddings(self, model_name: str = "sentence-transformers/all-MiniLM-L6-v2",
+                         backend: str = "torch") -> HuggingFaceEmbeddings:
+        """Configura el modelo de embeddings usando langchain_huggingface, con detección automática de CUDA.
+
+        `backend` se pasa a SentenceTransformer: "torch" (por defecto), "onnx" u "openvino".
+        Los backends distintos de torch requieren `optimum` y el runtime correspondiente."""
+        # Reutilizar el modelo ya cargado por este gestor
+        if self._embed_model is not None and self._embed_model_key == (model_name, backend):
+            return self._embed_model
 
-    def setup_embeddings(self, model_name: str = "sentence-transformers/all-MiniLM-L6-v2") -> HuggingFaceEmbeddings:
-        """Configura el modelo de embeddings usando langchain_huggingface, con detección automática de CUDA."""
         device = 'cuda' if torch.cuda.is_available() else 'cpu'
+        model_kwargs = {'device': device}
+        if backend != "torch":
+            model_kwargs['backend'] = backend
+        elif device == 'cuda':
+            # En GPU los pesos en FP16 duplican el rendimiento y reducen la VRAM a la mitad
+            model_kwargs['model_kwargs'] = {'torch_dtype': torch.float16}
+
+        if device == 'cuda':
+            # Longitudes de secuencia acotadas: cuDNN puede elegir y reutilizar el kernel más rápido
+            torch.backends.cudnn.benchmark = True
+        else:
+            # Tokenización en paralelo (rust) mientras el modelo calcula en CPU
+            os.environ.setdefault("TOKENIZERS_PARALLELISM", "true")
+        # Lotes grandes saturan la GPU; en CPU lotes pequeños mantienen baja la latencia y el padding
+        encode_kwargs = {
+            'normalize_embeddings': True,
+            'batch_size': 128 if device == 'cuda' else 16,
+            'show_progress_bar': False
+        }
         
         # Suprimir advertencias durante la carga del modelo
         with warnings.catch_warnings():
             warnings.simplefilter("ignore")
-            return HuggingFaceEmbeddings(
+            self._embed_model = HuggingFaceEmbeddings(
                 model_name=model_name,
-                model_kwargs={'device': device},
-                encode_kwargs={'normalize_embeddings': True}
+                model_kwargs=model_kwargs,
+                encode_kwargs=encode_kwargs
             )
+        self._embed_model_key = (model_name, backend)
+        return self._embed_model
+
+    def _collection_metadata(self, embed_model: Embeddings) -> Dict:
+        """Devuelve los metadatos para crear la colección: parámetros HNSW y métrica IP solo si los embeddings están normalizados."""
+        metadata = dict(HNSW_PARAMS)
+        encode_kwargs = getattr(embed_model, 'encode_kwargs', None) or {}
+        if encode_kwargs.get('normalize_embeddings'):
+            metadata.update(IP_COLLECTION_METADATA)
+        return metadata
+
+    def _client_obj(self) -> chromadb.ClientAPI:
+        """Devuelve el cliente persistente de chromadb, creándolo la primera vez."""
+        if self._client is None:
+            self._client = chromadb.PersistentClient(path=self.chroma_dir)
+        return self._client
 
     def collection_exists(self) -> bool:
         """Verifica si existe una colección previamente guardada con documentos."""
+        if self._exists_cache is not None:
+            return self._exists_cache
+
         if not Path(self.chroma_dir).exists():
             return False
 
         try:
-            # Se crea una instancia temporal para verificar si hay documentos
-            with warnings.catch_warnings():
-                warnings.simplefilter("ignore")
-                temp_store = Chroma(
-                    persist_directory=self.chroma_dir,
-                    collection_name=self.collection_name,
-                    embedding_function=self.setup_embeddings()
-                )
-                return temp_store._collection.count() > 0
-        except Exception as e:
-            print(f"Error verificando colección existente: {e}")
-            return False
+            # get_collection (no get_or_create) para no crear la colección sin sus metadatos HNSW
+            exists = self._client_obj().get_collection(self.collection_name).count() > 0
+        except Exception:
+            return False  # La colección no existe todavía
+
+        # Solo se cachea el resultado positivo: otra instancia del gestor puede crear la colección
+        if exists:
+            self._exists_cache = True
+        return exists
 
     def load_vectorstore(self, embed_model: Embeddings) -> bool:
-        """Carga el vectorstore existente si está disponible y lo asigna al atributo interno."""
+        """Abre la colección existente si está disponible y la asigna al atributo interno."""
         try:
             if self.collection_exists():
-                with warnings.catch_warnings():
-                    warnings.simplefilter("ignore")
-                    self.vectorstore = Chroma(
-                        embedding_function=embed_model,
-                        persist_directory=self.chroma_dir,
-                        collection_name=self.collection_name
-                    )
+                self.collection = self._client_obj().get_collection(self.collection_name, embedding_function=None)
+                self._embed_model = embed_model
                 return True
             return False
         except Exception as e:
@@ -89,106 +157,223 @@ class VectorStoreManager:
             return False
 
     def save_to_chroma(self, docs: List[Document], embed_model: Embeddings = None, 
-            document_name: str = "", document_type: str = "") -> Chroma:
-        """Guarda una lista de documentos en ChromaDB, añadiendo metadatos útiles para identificación y trazabilidad."""
+            document_name: str = "", document_type: str = "",
+            embeddings: Optional[List[List[float]]] = None) -> chromadb.Collection:
+        """Guarda una lista de documentos en ChromaDB, añadiendo metadatos útiles para identificación y trazabilidad.
+
+        Si se pasan `embeddings` (uno por documento, ya calculados), se insertan directamente
+        en la colección sin volver a invocar el modelo."""
         if not docs:
             raise ValueError("No hay documentos para guardar")
+        if embeddings is not None and len(embeddings) != len(docs):
+            raise ValueError("El número de embeddings no coincide con el número de documentos")
 
         if embed_model is None:
             embed_model = self.setup_embeddings()
 
-        # Generar un ID único para este batch
-        import uuid
-        from datetime import datetime
+        # Generar un ID único para este batch; fecha y modelo son comunes a todos sus documentos
         batch_id = str(uuid.uuid4())
+        ingest_time = datetime.now().isoformat()
+        embedding_model = getattr(embed_model, 'model_name', str(embed_model))
+        total_chunks = len(docs)
+        
+        # Nombre y tipo por archivo de origen: se resuelven una vez por fuente, no por chunk
+        # (un lote puede mezclar chunks de varios archivos)
+        source_names: Dict[str, tuple] = {}
         
         # Enriquecer metadatos por documento
         for i, doc in enumerate(docs):
             if not hasattr(doc, 'metadata') or doc.metadata is None:
                 doc.metadata = {}
+            
+            source = doc.metadata.get('source', '')
+            names = source_names.get(source)
+            if names is None:
+                names = source_names[source] = (
+                    document_name or os.path.basename(source or 'unknown'),
+                    document_type or os.path.splitext(source)[1][1:]
+                )
                 
             doc.metadata.update({
                 "doc_id": f"doc_{batch_id}_{i}",
                 "batch_id": batch_id,
-                "document_name": document_name or Path(doc.metadata.get('source', 'unknown')).name,
-                "document_type": document_type or Path(doc.metadata.get('source', '')).suffix[1:],
+                "document_name": names[0],
+                "document_type": names[1],
                 "chunk_number": i + 1,
-                "total_chunks": len(docs),
-                "ingest_time": datetime.now().isoformat(),
-                "embedding_model": getattr(embed_model, 'model_name', str(embed_model))
+                "total_chunks": total_chunks,
+                "ingest_time": ingest_time,
+                "embedding_model": embedding_model
             })
 
-        # Suprimir advertencias durante las operaciones de ChromaDB
-        with warnings.catch_warnings():
-            warnings.simplefilter("ignore")
-            
-            # Si la colección ya existe, intenta agregar sin duplicar
-            if self.collection_exists():
-                if not self.vectorstore or not hasattr(self.vectorstore, '_embedding_function') or self.vectorstore._embedding_function is None:
-                    self.vectorstore = Chroma(
-                        persist_directory=self.chroma_dir,
-                        collection_name=self.collection_name,
-                        embedding_function=embed_model
-                    )
-
-                try:
-                    # Obtener IDs existentes y filtrar duplicados
-                    existing_ids = self.vectorstore.get()['ids']
-                    new_docs = [doc for doc in docs if doc.metadata.get('doc_id') not in existing_ids]
-                    
-                    if new_docs:
-                        self.vectorstore.add_documents(new_docs)
-                except Exception as e:
-                    print(f"Error al añadir documentos: {e}")
-                    # Si falla, recrear la colección desde cero
-                    self.vectorstore = Chroma.from_documents(
-                        documents=docs,
-                        embedding=embed_model,
-                        persist_directory=self.chroma_dir,
-                        collection_name=self.collection_name
-                    )
-            else:
-                # Crear nueva colección con los documentos
-                self.vectorstore = Chroma.from_documents(
-                    documents=docs,
-                    embedding=embed_model,
-                    persist_directory=self.chroma_dir,
-                    collection_name=self.collection_name
+        # Abre la colección, o la crea vacía con sus metadatos (HNSW, métrica)
+        exists = self.collection_exists()
+        self._ensure_collection(embed_model)
+        
+        # Vectores precalculados: inserción directa en la colección
+        if embeddings is not None:
+            self._add_in_batches(docs, embed_model, embeddings=embeddings)
+        
+        # Si la colección ya existe, intenta agregar sin duplicar
+        elif exists:
+            try:
+                # Consultar solo los IDs entrantes (sin documentos, metadatos ni embeddings)
+                candidate_ids = [doc.metadata['doc_id'] for doc in docs]
+                existing_ids = set(self.collection.get(ids=candidate_ids, include=[])['ids'])
+                new_docs = [doc for doc in docs if doc.metadata['doc_id'] not in existing_ids]
+                
+                if new_docs:
+                    self._add_in_batches(new_docs, embed_model)
+            except Exception as e:
+                print(f"Error al añadir documentos: {e}")
+                # Si falla, reintentar la inserción completa por lotes
+                self._add_in_batches(docs, embed_model)
+        else:
+            # Colección nueva: inserción por lotes
+            self._add_in_batches(docs, embed_model)
+
+        self._exists_cache = True
+
+        # PersistentClient escribe en disco en cada operación: no hace falta persistir explícitamente
+        return self.collection
+
+    def _ensure_collection(self, embed_model: Embeddings) -> chromadb.Collection:
+        """Abre la colección, creándola vacía (con sus metadatos) si no existe.
+
+        Los metadatos (métrica, HNSW) solo se pasan al crearla: get_or_create_collection los
+        sobrescribiría en una colección existente, cuyo índice conserva la métrica original."""
+        if self.collection is None:
+            client = self._client_obj()
+            # embedding_function=None: los vectores siempre los calcula nuestro modelo
+            try:
+                # También abre colecciones existentes pero vacías (collection_exists devuelve False)
+                self.collection = client.get_collection(self.collection_name, embedding_function=None)
+            except Exception:
+                self.collection = client.create_collection(
+                    self.collection_name,
+                    metadata=self._collection_metadata(embed_model),
+                    embedding_function=None
                 )
+        self._embed_model = embed_model
+        return self.collection
 
-        # Intentar persistir (aunque podría ser automático)
-        try:
-            if hasattr(self.vectorstore, 'persist'):
-                self.vectorstore.persist()
-        except Exception as e:
-            print(f"Nota: No se pudo persistir explícitamente (esto podría ser normal): {e}")
-            
-        return self.vectorstore
+    def _add_in_batches(self, docs: List[Document], embed_model: Embeddings, batch_size: int = 200,
+                        embeddings: Optional[List[List[float]]] = None) -> None:
+        """Añade documentos en lotes de tamaño fijo (acotado al máximo que admite Chroma por llamada).
 
-    def get_document_stats(self, embed_model: Optional[Embeddings] = None) -> Dict[str, any]:
-        """Devuelve estadísticas del vectorstore: número de chunks, dimensión del embedding, y metadatos de ejemplo."""
-        if not embed_model:
-            embed_model = self.setup_embeddings()
-            
-        if not self.vectorstore:
-            self.load_vectorstore(embed_model)
-            
-        if not self.vectorstore:
-            with warnings.catch_warnings():
-                warnings.simplefilter("ignore")
-                self.vectorstore = Chroma(
-                    embedding_function=embed_model,
-                    persist_directory=self.chroma_dir,
-                    collection_name=self.collection_name
+        Con `embeddings` los vectores se insertan tal cual; sin ellos, se calculan todos de una vez
+        con `embed_model` (el modelo los agrupa según su propio batch_size)."""
+        max_batch = self._client_obj().get_max_batch_size()
+        batch_size = min(batch_size, max_batch) if max_batch else batch_size
+
+        # Listas construidas una sola vez; cada lote es una vista por slicing
+        ids = [doc.metadata['doc_id'] for doc in docs]
+        texts = [doc.page_content for doc in docs]
+        metadatas = [doc.metadata for doc in docs]
+        if embeddings is None:
+            embeddings = embed_model.embed_documents(texts)
+
+        for i in range(0, len(docs), batch_size):
+            self.collection.add(
+                ids=ids[i:i + batch_size],
+                documents=texts[i:i + batch_size],
+                metadatas=metadatas[i:i + batch_size],
+                embeddings=embeddings[i:i + batch_size]
+            )
+        self._index_chunk_meta(metadatas)
+
+    def _get_meta_connection(self) -> sqlite3.Connection:
+        """Obtiene una conexión al índice de metadatos de chunks (junto a los archivos de Chroma)."""
+        return sqlite3.connect(os.path.join(self.chroma_dir, "chunk_meta.db"))
+
+    def _create_meta_index(self) -> None:
+        """Crea la tabla del índice de metadatos de chunks si no existe."""
+        os.makedirs(self.chroma_dir, exist_ok=True)
+        with self._get_meta_connection() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS chunk_meta (
+                    doc_id TEXT PRIMARY KEY,
+                    document_name TEXT,
+                    document_type TEXT,
+                    batch_id TEXT,
+                    ingest_time TEXT
                 )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_chunk_meta_name ON chunk_meta (document_name)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_chunk_meta_batch ON chunk_meta (batch_id)")
+
+    def _index_chunk_meta(self, metadatas: List[Dict], ids: Optional[List[str]] = None) -> None:
+        """Registra los metadatos filtrables de los chunks añadidos en una sola transacción.
+
+        Sin `ids`, el ID de cada chunk se toma de su metadato 'doc_id'."""
+        if ids is None:
+            ids = [m['doc_id'] for m in metadatas]
+        with self._get_meta_connection() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO chunk_meta VALUES (?, ?, ?, ?, ?)",
+                [
+                    (doc_id, m.get('document_name'), m.get('document_type'),
+                     m.get('batch_id'), m.get('ingest_time'))
+                    for doc_id, m in zip(ids, (m or {} for m in metadatas))
+                ]
+            )
+
+    def _backfill_chunk_meta(self, page_size: int = 1000) -> None:
+        """Indexa los chunks de la colección que faltan en chunk_meta (p. ej. los añadidos antes de existir el índice).
+
+        Solo recorre la colección cuando el índice tiene menos filas que ella; se lee por páginas
+        y únicamente los metadatos."""
+        total = self.collection.count()
+        with self._get_meta_connection() as conn:
+            indexed = conn.execute("SELECT COUNT(*) FROM chunk_meta").fetchone()[0]
+        if indexed >= total:
+            return
+
+        for offset in range(0, total, page_size):
+            page = self.collection.get(include=["metadatas"], limit=page_size, offset=offset)
+            if not page['ids']:
+                break
+            self._index_chunk_meta(page['metadatas'], ids=page['ids'])
+
+    def _filter_candidate_ids(self, where: Dict[str, str]) -> List[str]:
+        """Devuelve los IDs de chunks cuyos metadatos coinciden con todos los filtros de `where`."""
+        unknown = set(where) - set(CHUNK_META_FIELDS)
+        if unknown:
+            raise ValueError(f"Campos no filtrables: {sorted(unknown)}. Use {CHUNK_META_FIELDS}")
+        self._backfill_chunk_meta()
+        clauses = " AND ".join(f"{field} = ?" for field in where)
+        with self._get_meta_connection() as conn:
+            cursor = conn.execute(f"SELECT doc_id FROM chunk_meta WHERE {clauses}", list(where.values()))
+            return [row[0] for row in cursor.fetchall()]
 
+    def _open_collection(self) -> Optional[chromadb.Collection]:
+        """Abre la colección existente sin crearla ni cargar el modelo de embeddings (None si no hay)."""
+        if self.collection is None and self.collection_exists():
+            self.collection = self._client_obj().get_collection(self.collection_name, embedding_function=None)
+        return self.collection
+
+    def _query_model(self, embed_model: Optional[Embeddings] = None) -> Embeddings:
+        """Modelo para embeber consultas: el recibido, el ya usado por este gestor o, en último caso, uno nuevo."""
+        return embed_model or self._embed_model or self.setup_embeddings()
+
+    def get_document_stats(self) -> Dict[str, any]:
+        """Devuelve estadísticas del vectorstore: número de chunks, dimensión del embedding, y metadatos de ejemplo.
+
+        No necesita el modelo de embeddings: la dimensión se lee de un vector ya almacenado."""
         try:
-            stored_data = self.vectorstore.get()
-            count = self.vectorstore._collection.count()
-            test_embedding = embed_model.embed_query("Texto de prueba")
-            embedding_dim = len(test_embedding)
-            sample_metadatas = stored_data['metadatas'][:3] if count > 0 else []
-            sample_ids = stored_data['ids'][:3] if count > 0 else []
+            if self._open_collection() is None:
+                return {"total_chunks": 0, "embedding_dim": 0, "sample_metadatas": [],
+                        "sample_ids": [], "metadata_fields": []}
+
+            count = self.collection.count()
+            # Solo se leen unos pocos registros de ejemplo, no la colección completa
+            if count > 0:
+                sample = self.collection.get(limit=3, include=["metadatas", "embeddings"])
+            else:
+                sample = {'ids': [], 'metadatas': [], 'embeddings': []}
+            sample_metadatas = sample['metadatas']
+            sample_ids = sample['ids']
+            embeddings = sample['embeddings']
+            embedding_dim = len(embeddings[0]) if embeddings is not None and len(embeddings) else 0
 
             return {
                 "total_chunks": count,
@@ -206,41 +391,149 @@ class VectorStoreManager:
                 "embedding_dim": 0
             }
 
-    def similarity_search(self, query: str, k: int = 5) -> List[tuple[Document, float]]:
-        """Realiza búsqueda semántica usando embeddings y retorna los k documentos más similares."""
-        if not self.vectorstore:
-            raise ValueError("Vector store no inicializado. Llama a save_to_chroma() primero.")
-        return self.vectorstore.similarity_search_with_score(query, k=k)
+    def similarity_search(self, query: str, k: int = 5, where: Optional[Dict[str, str]] = None,
+                          embed_model: Optional[Embeddings] = None) -> List[tuple[Document, float]]:
+        """Realiza búsqueda semántica usando embeddings y retorna los k documentos más similares (con su distancia).
+
+        `where` filtra por igualdad en CHUNK_META_FIELDS (p. ej. {"document_name": "informe.pdf"}).
+        Los IDs candidatos salen del índice SQLite; con pocos candidatos (hasta
+        FILTER_EXACT_MAX_CANDIDATES) se puntúan todos exactamente con numpy, con más se
+        pide a HNSW un múltiplo de k proporcional a la selectividad y se filtra después.
+
+        `embed_model` permite reutilizar el modelo ya cargado por la app para embeber la consulta."""
+        # El gestor se crea de nuevo en cada rerun: la colección se abre aquí, sin depender de otras llamadas
+        if self._open_collection() is None:
+            return []  # Aún no hay documentos indexados
+        embed_model = self._query_model(embed_model)
+        query_embedding = embed_model.embed_query(query)
+
+        if where:
+            candidate_ids = self._filter_candidate_ids(where)
+            if not candidate_ids:
+                return []
+            if len(candidate_ids) <= FILTER_EXACT_MAX_CANDIDATES:
+                return self._exact_search(query_embedding, candidate_ids, k)
+
+            # Sobremuestreo: con selectividad s hacen falta ~k/s resultados para obtener k tras filtrar
+            total = self.collection.count()
+            n_results = min(total, 2 * k * total // len(candidate_ids))
+        else:
+            n_results = k
+
+        result = self.collection.query(
+            query_embeddings=[query_embedding],
+            n_results=n_results,
+            include=["documents", "metadatas", "distances"]
+        )
+        hits = zip(result['ids'][0], result['documents'][0], result['metadatas'][0], result['distances'][0])
+        if where:
+            allowed = set(candidate_ids)
+            hits = (hit for hit in hits if hit[0] in allowed)
+        return [
+            (Document(page_content=text, metadata=metadata or {}), distance)
+            for _, text, metadata, distance in hits
+        ][:k]
+
+    def _exact_search(self, query_embedding: List[float], candidate_ids: List[str],
+                      k: int) -> List[tuple[Document, float]]:
+        """Puntúa exactamente un conjunto reducido de chunks y devuelve los k más cercanos.
+
+        Las distancias siguen la métrica de la colección ("ip", "cosine" o "l2"), igual que las de HNSW."""
+        result = self.collection.get(ids=candidate_ids, include=["embeddings", "documents", "metadatas"])
+        if not result['ids']:
+            return []
+
+        vectors = np.ascontiguousarray(result['embeddings'], dtype=np.float32)
+        query_vec = np.asarray(query_embedding, dtype=np.float32)
+        space = (self.collection.metadata or {}).get("hnsw:space", "l2")
+        if space == "ip":
+            distances = 1.0 - vectors @ query_vec
+        elif space == "cosine":
+            norms = np.linalg.norm(vectors, axis=1) * np.linalg.norm(query_vec) + 1e-12
+            distances = 1.0 - (vectors @ query_vec) / norms
+        else:
+            distances = np.sum((vectors - query_vec) ** 2, axis=1)
+
+        top = np.argsort(distances)[:k]
+        return [
+            (Document(page_content=result['documents'][i], metadata=result['metadatas'][i] or {}),
+             float(distances[i]))
+            for i in top
+        ]
+
+    def max_marginal_relevance_search(self, query: str, k: int = 5, fetch_k: int = 20,
+                                      lambda_mult: float = 0.5,
+                                      embed_model: Optional[Embeddings] = None) -> List[Document]:
+        """Búsqueda MMR: recupera `fetch_k` candidatos y selecciona `k` equilibrando relevancia y diversidad.
+
+        Las similitudes se calculan una sola vez sobre la matriz de candidatos (numpy);
+        `lambda_mult` cercano a 1 prioriza relevancia, cercano a 0 diversidad."""
+        # El gestor se crea de nuevo en cada rerun: la colección se abre aquí, sin depender de otras llamadas
+        if self._open_collection() is None:
+            return []  # Aún no hay documentos indexados
+        embed_model = self._query_model(embed_model)
+        query_embedding = embed_model.embed_query(query)
+
+        result = self.collection.query(
+            query_embeddings=[query_embedding],
+            n_results=fetch_k,
+            include=["embeddings", "documents", "metadatas"]
+        )
+        texts, metadatas = result['documents'][0], result['metadatas'][0]
+        if not texts:
+            return []
+
+        # Matriz de candidatos y consulta normalizadas: el producto interno es la similitud coseno
+        candidates = np.ascontiguousarray(result['embeddings'][0], dtype=np.float32)
+        candidates /= np.linalg.norm(candidates, axis=1, keepdims=True) + 1e-12
+        query_vec = np.asarray(query_embedding, dtype=np.float32)
+        query_vec /= np.linalg.norm(query_vec) + 1e-12
+
+        query_sim = candidates @ query_vec
+        selected = [int(np.argmax(query_sim))]
+        # Similitud máxima de cada candidato con los ya seleccionados (se actualiza en el sitio)
+        max_div = candidates @ candidates[selected[0]]
+
+        while len(selected) < min(k, len(texts)):
+            scores = lambda_mult * query_sim - (1 - lambda_mult) * max_div
+            scores[selected] = -np.inf
+            idx = int(np.argmax(scores))
+            selected.append(idx)
+            np.maximum(max_div, candidates @ candidates[idx], out=max_div)
+
+        return [Document(page_content=texts[i], metadata=metadatas[i] or {}) for i in selected]
 
     def delete_documents(self, doc_ids: List[str]) -> None:
         """Elimina documentos específicos del vectorstore usando sus IDs."""
-        if self.vectorstore:
-            self.vectorstore.delete(doc_ids)
-            self.vectorstore.persist()
+        if self.collection is not None:
+            self.collection.delete(ids=doc_ids)
+            self._exists_cache = None  # La colección pudo quedar vacía
+            with self._get_meta_connection() as conn:
+                conn.executemany("DELETE FROM chunk_meta WHERE doc_id = ?", [(doc_id,) for doc_id in doc_ids])
 
     def persist(self) -> None:
-        """Fuerza la persistencia del vectorstore en disco (si está soportado)."""
-        if self.vectorstore:
-            try:
-                if hasattr(self.vectorstore, 'persist'):
-                    self.vectorstore.persist()
-            except Exception as e:
-                print(f"Nota: No se pudo persistir explícitamente (esto podría ser normal): {e}")
+        """Compatibilidad: el cliente persistente de chromadb ya escribe en disco en cada operación."""
+        pass
 
     def clear_vectorstore(self) -> None:
         """Elimina completamente la base de datos local de Chroma, con soporte para Windows (manejo de archivos bloqueados)."""
         try:
-            if self.vectorstore is not None:
-                self.vectorstore = None
-            
-            import time
-            time.sleep(1)  # Esperar para liberar handles de archivo
+            # Soltar las referencias a la colección y al cliente antes de borrar los archivos
+            self.collection = None
+            self._exists_cache = None
+            if self._client is not None:
+                self._client.clear_system_cache()
+                self._client = None
+            # Liberar de forma determinista los handles de archivo que aún referencian la colección
+            gc.collect()
             
             if Path(self.chroma_dir).exists():
                 if os.name == 'nt':
                     self._force_delete_windows(self.chroma_dir)
                 else:
                     shutil.rmtree(self.chroma_dir)
+            # El índice de metadatos vivía en el mismo directorio: se recrea vacío
+            self._create_meta_index()
             
             print(f"✅ Vectorstore en {self.chroma_dir} eliminado completamente")
         
@@ -250,16 +543,17 @@ class VectorStoreManager:
                 self._find_locking_processes(self.chroma_dir)
 
     def _force_delete_windows(self, path: str) -> None:
-        """Utiliza comandos nativos de Windows para forzar la eliminación de un directorio."""
-        import subprocess
+        """Elimina un directorio recorriéndolo de abajo arriba (sin lanzar cmd.exe), con reintentos si hay archivos bloqueados."""
         try:
-            subprocess.run(f'rmdir /s /q "{path}"', shell=True, check=True)
-        except subprocess.CalledProcessError:
+            for root, dirs, files in os.walk(path, topdown=False):
+                for name in files:
+                    os.unlink(os.path.join(root, name))
+                os.rmdir(root)
+        except PermissionError:
             self._retry_delete(path, max_attempts=3)
 
     def _retry_delete(self, path: str, max_attempts: int = 3) -> None:
         """Reintenta la eliminación de un directorio varias veces, útil si hay bloqueos temporales."""
-        import time
         for attempt in range(max_attempts):
             try:
                 shutil.rmtree(path)